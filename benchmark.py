@@ -0,0 +1,838 @@
+import argparse
+import calendar
+import csv
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+from time import perf_counter, process_time
+
+# -----------------------------------GLOBALS-----------------------------------#
+
+# Corpus sizes measured when none are given on the command line
+GAME_COUNTS = [1000, 10000, 100000]
+
+# Shape of the synthetic corpus: games in each monthly archive, full moves in
+# each game and the first month the fake player has games in
+GAMES_PER_MONTH = 1000
+MOVES_PER_GAME = 40
+FIRST_MONTH = date(2010, 1, 1)
+
+# Import history sizes the ID index is measured at with --ids, and the number
+# of lookups timed for each. The list of IDs the script searched before the
+# set is only measured up to LIST_MAX_IDS, and with fewer lookups, as every
+# lookup scans it from the start.
+ID_COUNTS = [100000, 1000000, 10000000]
+LOOKUPS = 100000
+LIST_MAX_IDS = 100000
+LIST_LOOKUPS = 1000
+
+# Number of games written to the local PGN archives measured with --archive
+ARCHIVE_GAMES = 100000
+
+# Number of games whose headers are parsed with --tags
+TAG_GAMES = 20000
+
+# The regex chess2lichess pulled the "database" columns out of PGNs with before
+# parse_tags, kept to measure it against. Its ten groups are joined with .+
+# under (?s), so it backtracks through the move text of every game.
+LEGACY_TAGS = [
+    "(?s)",
+    r'(White "(?P<white>\S+)")',
+    r'(Black "(?P<black>\S+)")',
+    r'(UTCDate "(?P<date>\d+.\d+.\d+)")',
+    r'(UTCTime "(?P<time>\d+:\d+:\d+)")',
+    r'(WhiteElo "(?P<white_elo>\d+)")',
+    r'(BlackElo "(?P<black_elo>\d+)")',
+    r'(TimeControl "(?P<time_control>\d+[/\+\d+]{0,})")',
+    r'(Termination "(?P<termination>(\S+\s){,10}\w+)")',
+    r"(Link .+/(?P<game_id>\d+))",
+]
+LEGACY_TAG_PATTERN = re.compile(".+".join(LEGACY_TAGS))
+
+# Fields both parsers extract, compared game by game
+TAG_FIELDS = [
+    "game_id",
+    "date",
+    "time",
+    "white",
+    "white_elo",
+    "black",
+    "black_elo",
+    "time_control",
+    "termination",
+]
+
+# Name of the fake chess.com player
+USERNAME = "benchmark"
+
+# Pool of moves the synthetic games are drawn from. lichess.org is stubbed out,
+# so the games only need to look like chess.com's PGN, not be legal.
+MOVES = [
+    "e4", "e5", "d4", "d5", "Nf3", "Nc6", "Bb5", "a6", "Ba4", "Nf6", "O-O",
+    "Be7", "Re1", "b5", "Bb3", "d6", "c3", "O-O", "h3", "Nb8", "exd5", "Qxd5",
+    "Nc3", "Bg4", "Qd2", "Rfe8", "cxd4", "Nxe4", "Bxf7+", "Kh8", "g3", "Qe7",
+]
+
+# Time controls in seconds, with the increment where there is one
+TIME_CONTROLS = ["60", "180", "180+2", "300", "600", "1800"]
+
+# --------------------------------SYNTHETIC PGNS--------------------------------#
+
+
+def format_clock(seconds: float) -> str:
+    """
+    Formats remaining time the way chess.com writes it in %clk comments.
+    """
+    minutes, seconds = divmod(max(seconds, 0.0), 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02d}:{seconds:04.1f}"
+
+
+def make_game(year: int, month: int, index: int, moves: int, clocks: bool) -> dict:
+    """
+    Builds one synthetic chess.com game, deterministically from its position
+    in the corpus. Returns the same fields chess.com's JSON archive has.
+    """
+    rng = random.Random(year * 10**8 + month * 10**6 + index)
+    game_id = (year * 100 + month) * 10**6 + index
+    opponent = f"opponent{rng.randrange(500)}"
+    white, black = (USERNAME, opponent) if index % 2 else (opponent, USERNAME)
+    white_elo, black_elo = rng.randint(800, 2800), rng.randint(800, 2800)
+    time_control = rng.choice(TIME_CONTROLS)
+    base, _, increment = time_control.partition("+")
+    increment = int(increment or 0)
+    end_time = calendar.timegm(
+        (year, month, 1 + index % 28, index % 24, rng.randrange(60), rng.randrange(60))
+    )
+    day = f"{year}.{month:02d}.{1 + index % 28:02d}"
+    result, termination, white_result, black_result = rng.choice(
+        [
+            ("1-0", f"{white} won by resignation", "win", "resigned"),
+            ("0-1", f"{black} won on time", "timeout", "win"),
+            ("1/2-1/2", "Game drawn by agreement", "agreed", "agreed"),
+        ]
+    )
+
+    movetext = []
+    remaining = [float(base), float(base)]
+    for number in range(1, moves + 1):
+        for side in (0, 1):
+            san = rng.choice(MOVES)
+            remaining[side] -= rng.uniform(0.5, float(base) / moves) - increment
+            comment = f" {{[%clk {format_clock(remaining[side])}]}}" if clocks else ""
+            prefix = f"{number}. " if side == 0 else (f"{number}... " if clocks else "")
+            movetext.append(f"{prefix}{san}{comment}")
+    movetext.append(result)
+
+    headers = [
+        ("Event", "Live Chess"),
+        ("Site", "Chess.com"),
+        ("Date", day),
+        ("Round", "-"),
+        ("White", white),
+        ("Black", black),
+        ("Result", result),
+        ("CurrentPosition", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"),
+        ("Timezone", "UTC"),
+        ("ECO", "C65"),
+        ("ECOUrl", "https://www.chess.com/openings/Ruy-Lopez-Opening-Berlin-Defense"),
+        ("UTCDate", day),
+        ("UTCTime", f"{index % 24:02d}:00:00"),
+        ("WhiteElo", str(white_elo)),
+        ("BlackElo", str(black_elo)),
+        ("TimeControl", time_control),
+        ("Termination", termination),
+        ("StartTime", f"{index % 24:02d}:00:00"),
+        ("EndDate", day),
+        ("EndTime", f"{index % 24:02d}:10:00"),
+        ("Link", f"https://www.chess.com/game/live/{game_id}"),
+    ]
+    pgn = "\n".join(f'[{name} "{value}"]' for name, value in headers)
+    pgn += "\n\n" + " ".join(movetext) + "\n"
+    return {
+        "url": f"https://www.chess.com/game/live/{game_id}",
+        "pgn": pgn,
+        "time_control": time_control,
+        "end_time": end_time,
+        "rated": True,
+        "time_class": "blitz",
+        "rules": "chess",
+        "white": {"username": white, "rating": white_elo, "result": white_result},
+        "black": {"username": black, "rating": black_elo, "result": black_result},
+    }
+
+
+def corpus_months(games: int, games_per_month: int) -> list:
+    """
+    Returns (year, month, game count) for every month of a corpus of the given
+    size, starting at FIRST_MONTH.
+    """
+    months = []
+    month = FIRST_MONTH
+    while games > 0:
+        months.append((month.year, month.month, min(games, games_per_month)))
+        games -= games_per_month
+        month += relativedelta(months=1)
+    return months
+
+
+# ---------------------------------STUB SERVER---------------------------------#
+
+
+class StubServer:
+    """
+    Local stand-in for both the chess.com published-data API and the
+    lichess.org import endpoint, serving a synthetic corpus. Runs in the
+    benchmark's parent process so it is not counted in the client's CPU time
+    or memory. Every throttle_every-th import is answered with a 429.
+    """
+
+    def __init__(self, months: list, moves: int, clocks: bool, throttle_every=0) -> None:
+        self.months = {(year, month): count for year, month, count in months}
+        self.moves = moves
+        self.clocks = clocks
+        self.throttle_every = throttle_every
+        self.imports = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @lru_cache(maxsize=8)
+    def month_games(self, year: int, month: int) -> list:
+        """
+        Generates every game of one month, keeping the last few months around
+        while the client's workers download them.
+        """
+        count = self.months.get((year, month), 0)
+        return [make_game(year, month, i, self.moves, self.clocks) for i in range(count)]
+
+    def handler(self):
+        """
+        Builds the request handler class bound to this server.
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes
+            disable_nagle_algorithm = True
+
+            def send(self, status: int, body: str, content_type="text/plain", headers=()):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # /chesscom/<user>/games/archives, .../games/YYYY/MM[/pgn]
+                parts = self.path.strip("/").split("/")
+                if parts[-1] == "archives":
+                    archives = [
+                        f"{stub.url}/chesscom/{parts[1]}/games/{year}/{month:02d}"
+                        for year, month in sorted(stub.months)
+                    ]
+                    return self.send(200, json.dumps({"archives": archives}), "application/json")
+                year, month = int(parts[3]), int(parts[4])
+                games = stub.month_games(year, month)
+                if parts[-1] == "pgn":
+                    return self.send(200, "\n\n\n".join(g["pgn"].rstrip("\n") for g in games))
+                self.send(200, json.dumps({"games": games}), "application/json")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.imports += 1
+                if stub.throttle_every and stub.imports % stub.throttle_every == 0:
+                    return self.send(429, "Too many requests", headers=[("Retry-After", "60")])
+                self.send(200, json.dumps({"id": "AbCdEfGh", "url": "https://lichess.org/AbCdEfGh"}), "application/json")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ------------------------------------CLIENT-----------------------------------#
+
+
+def run_client(options: dict) -> dict:
+    """
+    Imports the whole corpus from the stub server with a fresh local
+    "database" in a temporary directory. Runs in its own process so peak
+    memory is measured per corpus size.
+    """
+    os.environ["CHESSCOM_API"] = f"{options['url']}/chesscom"
+    os.environ["LICHESS_IMPORT_URL"] = f"{options['url']}/lichess/api/import"
+    os.environ.setdefault("LICHESS_TOKEN", "benchmark")
+    import chess2lichess as c2l
+
+    first, last = options["months"][0], options["months"][-1]
+    clock = c2l.VirtualClock()
+    stats = c2l.StageTimer()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        client = c2l.Chess2Lichess(
+            USERNAME,
+            verbose=False,
+            convert_local=True,
+            max_workers=options["workers"],
+            rate_limiter=c2l.RateLimiter(
+                options["rate"] or c2l.IMPORT_RATE,
+                options["max_rate"] or c2l.MAX_IMPORT_RATE,
+                clock=clock.time,
+                sleep=clock.sleep,
+            ),
+            database=c2l.SqliteDatabase() if options["sqlite"] else c2l.CsvDatabase(),
+            source=options["source"],
+            stats=stats,
+        )
+        wall, cpu = perf_counter(), process_time()
+        client.check_db_existence()
+        games = client.check_already_imported(
+            client.fetch_range(f"{first[0]}/{first[1]:02d}", f"{last[0]}/{last[1]:02d}")
+        )
+        if options["pipeline"]:
+            games = c2l.pipelined(games)
+        imported = client.import_pgns(games)
+        client.close()
+        wall, cpu = perf_counter() - wall, process_time() - cpu
+        os.chdir("/")
+
+    return {
+        "games": imported,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_bytes": peak_rss(),
+        "us_per_game": round(wall / imported * 1e6, 1) if imported else None,
+        "virtual_seconds": round(clock.now, 1),
+        "stages": stats.report()["stages"],
+    }
+
+
+def anonymous_memory() -> int:
+    """
+    Returns the memory of this process not backed by a file, in bytes, so
+    memory-mapped index pages (which the OS can drop at any time) are left
+    out. Only known on Linux; 0 elsewhere.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident memory of this process in bytes.
+    """
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def benchmark(games: int, args) -> dict:
+    """
+    Serves a corpus of the given size and measures one client importing it.
+    """
+    months = corpus_months(games, args.games_per_month)
+    server = StubServer(months, args.moves, not args.no_clocks, args.throttle_every)
+    server.start()
+    options = {
+        "task": "import",
+        "url": server.url,
+        "months": months,
+        "workers": args.workers,
+        "rate": args.rate,
+        "max_rate": args.max_rate,
+        "sqlite": args.sqlite,
+        "source": "json" if args.json else "pgn",
+        "pipeline": args.pipeline,
+    }
+    try:
+        return run_child(options)
+    finally:
+        server.stop()
+
+
+def run_child(options: dict) -> dict:
+    """
+    Runs one measurement in a fresh Python process and returns its result.
+    """
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--client", json.dumps(options)],
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # The client's own progress messages come before the result line
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def print_result(result: dict) -> None:
+    """
+    Prints a summary line and the per-stage cost of one benchmark run.
+    """
+    print(
+        f"{result['games']:>7} games: {result['wall_seconds']:8.2f}s wall, "
+        f"{result['cpu_seconds']:8.2f}s CPU, "
+        f"{result['peak_rss_bytes'] / 2**20:6.1f} MB peak RSS, "
+        f"{result['us_per_game']:8.1f} us/game, "
+        f"{result['virtual_seconds'] / 3600:8.1f} h of rate limiting"
+    )
+    for stage, row in sorted(result["stages"].items(), key=lambda s: -s[1]["total_seconds"]):
+        per_game = row["total_seconds"] / result["games"] * 1e6
+        print(
+            f"    {stage:<22} {row['total_seconds']:8.2f}s {per_game:8.1f} us/game "
+            f"(p50 {row['p50_ms']:.3f} ms, p99 {row['p99_ms']:.3f} ms)"
+        )
+
+
+# ----------------------------------ID INDEX-----------------------------------#
+
+
+def imported_id(index: int) -> str:
+    """
+    Returns the ID of the index-th game of a synthetic import history. IDs
+    grow like chess.com's do, with a gap after each one that no imported game
+    falls into.
+    """
+    return str(10**10 + index * 100 + index * 7919 % 50)
+
+
+def missing_id(index: int) -> str:
+    """
+    Returns an ID that sits among the imported ones but is not one of them.
+    """
+    return str(10**10 + index * 100 + 50 + index * 104729 % 50)
+
+
+def write_history(path: str, count: int) -> None:
+    """
+    Writes a .csv "database" with count rows.
+    """
+    with open(path, "w") as file:
+        file.write("game_id,game_date,game_time,white,white_elo,black,black_elo,time_control,termination\n")
+        for index in range(count):
+            file.write(
+                f"{imported_id(index)},2020/01/01,12:00:00,{USERNAME},1500,opponent,1500,180,Game drawn by agreement\n"
+            )
+
+
+class ListDatabase:
+    """
+    The duplicate check chess2lichess did before the set of IDs: every row of
+    the .csv "database" read into a list, searched from the start for each
+    fetched game.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.ids = None
+
+    def create(self) -> None:
+        pass
+
+    def is_imported(self, game_id: str) -> bool:
+        if self.ids is None:
+            with open(self.path, "r+") as file:
+                self.ids = [row[0] for row in csv.reader(file)]
+        return len(self.ids) > 1 and game_id in self.ids
+
+    def add(self, row: list) -> None:
+        self.ids.append(row[0])
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def run_lookups(options: dict) -> dict:
+    """
+    Opens the .csv "database" one way - the list of IDs searched before the
+    set, the set of IDs, or the ID index with or without its Bloom filter -
+    and times lookups of imported and missing games. Runs in its own process
+    so memory is measured for each.
+    """
+    import chess2lichess as c2l
+
+    os.chdir(options["directory"])
+    rng = random.Random(options["count"])
+    lookups = LIST_LOOKUPS if options["mode"] == "list" else LOOKUPS
+    hits = [imported_id(rng.randrange(options["count"])) for _ in range(lookups)]
+    misses = [missing_id(rng.randrange(options["count"])) for _ in range(lookups)]
+    index = None
+    if options["mode"] in ("no bloom", "bloom"):
+        index = c2l.IdIndex(bloom=options["mode"] == "bloom")
+    if options["mode"] == "list":
+        database = ListDatabase(c2l.CSV_DATABASE)
+    else:
+        database = c2l.CsvDatabase(index=index)
+
+    baseline, anonymous = peak_rss(), anonymous_memory()
+    started = perf_counter()
+    database.create()
+    database.is_imported("0")
+    opened = perf_counter() - started
+
+    timings = {}
+    for name, game_ids in (("hit", hits), ("miss", misses)):
+        started = perf_counter()
+        found = sum(database.is_imported(game_id) for game_id in game_ids)
+        timings[name] = (perf_counter() - started) / len(game_ids) * 1e6
+        assert found == (len(game_ids) if name == "hit" else 0)
+
+    # Later runs look these up neither as hits nor as misses
+    started = perf_counter()
+    for offset in range(1, 1001):
+        database.add([imported_id(options["count"] + offset)] + [""] * 8)
+    database.flush()
+    added = (perf_counter() - started) / 1000 * 1e6
+    anonymous = anonymous_memory() - anonymous
+    database.close()
+
+    files = [c2l.ID_INDEX, c2l.ID_INDEX + ".bloom"] if index else []
+    return {
+        "count": options["count"],
+        "mode": options["mode"],
+        "open_seconds": round(opened, 3),
+        "memory_bytes": peak_rss() - baseline,
+        "anonymous_bytes": anonymous,
+        "disk_bytes": sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+        "hit_us": round(timings["hit"], 2),
+        "miss_us": round(timings["miss"], 2),
+        "add_us": round(added, 2),
+    }
+
+
+def benchmark_ids(count: int) -> list:
+    """
+    Measures the set of IDs and the ID index over the same import history,
+    and at smaller sizes the list of IDs the set replaced. The first index
+    run builds it from the .csv file and the first one with the Bloom filter
+    builds that; the others open them as an ordinary run would.
+    """
+    results = []
+    modes = [("list", "list")] if count <= LIST_MAX_IDS else []
+    with tempfile.TemporaryDirectory() as directory:
+        write_history(os.path.join(directory, "pgn_database.csv"), count)
+        for label, mode in modes + [
+            ("set", "set"),
+            ("build", "no bloom"),
+            ("no bloom", "no bloom"),
+            ("+ bloom", "bloom"),
+            ("bloom", "bloom"),
+        ]:
+            options = {"task": "ids", "directory": directory, "count": count, "mode": mode}
+            result = run_child(options)
+            result["mode"] = label
+            results.append(result)
+    return results
+
+
+def print_id_result(result: dict) -> None:
+    """
+    Prints one ID index measurement.
+    """
+    print(
+        f"{result['count']:>9} IDs, {result['mode']:<8}: opened in {result['open_seconds']:7.2f}s, "
+        f"{result['memory_bytes'] / 2**20:7.1f} MB resident ({result['anonymous_bytes'] / 2**20:6.1f} MB not file-backed), "
+        f"{result['disk_bytes'] / 2**20:6.1f} MB index, "
+        f"{result['hit_us']:5.2f} us/hit, {result['miss_us']:5.2f} us/miss, {result['add_us']:6.2f} us/add"
+    )
+
+
+# ---------------------------------TAG PARSING---------------------------------#
+
+
+def benchmark_tags(games: int, args) -> dict:
+    """
+    Pulls the "database" columns out of every game of a synthetic corpus with
+    the old regex and with parse_tags, and counts the games they disagree on,
+    field by field. The old code ran the regex once to deduplicate a game and
+    again to record it.
+    """
+    import chess2lichess as c2l
+
+    corpus = [
+        make_game(year, month, i, args.moves, not args.no_clocks)["pgn"].rstrip("\n")
+        for year, month, count in corpus_months(games, args.games_per_month)
+        for i in range(count)
+    ]
+
+    started = perf_counter()
+    legacy = [LEGACY_TAG_PATTERN.search(pgn).group(*TAG_FIELDS) for pgn in corpus]
+    legacy_seconds = perf_counter() - started
+    started = perf_counter()
+    parsed = [c2l.parse_tags(pgn) for pgn in corpus]
+    parse_seconds = perf_counter() - started
+
+    mismatches = {}
+    for old, new in zip(legacy, parsed):
+        for field, value in zip(TAG_FIELDS, old):
+            if value != getattr(new, field):
+                mismatches[field] = mismatches.get(field, 0) + 1
+    return {
+        "games": games,
+        "bytes": sum(len(pgn) for pgn in corpus),
+        "legacy_seconds": round(legacy_seconds, 3),
+        "parse_tags_seconds": round(parse_seconds, 3),
+        "speedup": round(legacy_seconds / parse_seconds, 1),
+        "mismatches": mismatches,
+    }
+
+
+def print_tag_result(result: dict) -> None:
+    """
+    Prints one tag parsing measurement.
+    """
+    print(
+        f"{result['games']} games, {result['bytes'] / 2**20:.1f} MB of PGN: "
+        f"old regex {result['legacy_seconds']:.2f}s "
+        f"({result['legacy_seconds'] / result['games'] * 1e6:.1f} us/game), "
+        f"parse_tags {result['parse_tags_seconds']:.2f}s "
+        f"({result['parse_tags_seconds'] / result['games'] * 1e6:.1f} us/game), "
+        f"{result['speedup']:.1f}x faster"
+    )
+    for field, count in result["mismatches"].items():
+        print(f"    {count} games disagree on {field}")
+
+
+# -----------------------------------ARCHIVE-----------------------------------#
+
+
+def benchmark_archive(games: int, args) -> dict:
+    """
+    Writes a synthetic corpus to both the single local PGN text document
+    and the segmented archive, sealing every month, then streams every game
+    back out of each. Reports sizes, the compression ratio and throughput.
+    """
+    import chess2lichess as c2l
+
+    result = {"games": games}
+    with tempfile.TemporaryDirectory() as directory:
+        flat = c2l.LocalPgns(
+            os.path.join(directory, c2l.LOCAL_PGNS), os.path.join(directory, c2l.PGN_INDEX)
+        )
+        archive = c2l.SegmentedArchive(os.path.join(directory, c2l.PGN_ARCHIVE))
+        written = {"flat": 0.0, "segmented": 0.0}
+        for year, month, count in corpus_months(games, args.games_per_month):
+            corpus = [make_game(year, month, i, args.moves, not args.no_clocks) for i in range(count)]
+            for name, target in (("flat", flat), ("segmented", archive)):
+                started = perf_counter()
+                for game in corpus:
+                    if target is flat:
+                        target.write(game["pgn"].rstrip("\n"), game["url"].rsplit("/", 1)[-1])
+                    else:
+                        target.write(game["pgn"].rstrip("\n"), USERNAME, f"{year}.{month:02d}.01")
+                written[name] += perf_counter() - started
+        started = perf_counter()
+        flat.close()
+        written["flat"] += perf_counter() - started
+        started = perf_counter()
+        archive.close()
+        result["seal_seconds"] = round(perf_counter() - started, 2)
+        written["segmented"] += result["seal_seconds"]
+
+        entries = archive.manifest.values()
+        result["raw_bytes"] = sum(e["bytes"] for e in entries)
+        result["stored_bytes"] = sum(e["stored_bytes"] for e in entries)
+        result["segments"] = len(entries)
+        result["ratio"] = round(result["raw_bytes"] / result["stored_bytes"], 2)
+
+        def read_flat():
+            with open(flat.path, "r", encoding="utf-8") as file:
+                yield from c2l.split_pgn_stream(iter(lambda: file.read(c2l.CHUNK_SIZE), ""))
+
+        for name, reader in (("flat", read_flat), ("segmented", archive.read)):
+            started = perf_counter()
+            count = sum(1 for _ in reader())
+            elapsed = perf_counter() - started
+            assert count == games, (name, count)
+            result[f"{name}_write_seconds"] = round(written[name], 2)
+            result[f"{name}_read_seconds"] = round(elapsed, 2)
+            result[f"{name}_read_mb_per_second"] = round(result["raw_bytes"] / elapsed / 2**20, 1)
+            result[f"{name}_read_games_per_second"] = round(games / elapsed)
+    return result
+
+
+def print_archive_result(result: dict) -> None:
+    """
+    Prints one local PGN archive measurement.
+    """
+    print(
+        f"{result['games']} games, {result['raw_bytes'] / 2**20:.1f} MB of PGN: "
+        f"{result['segments']} segments take {result['stored_bytes'] / 2**20:.1f} MB "
+        f"({result['ratio']:.1f}x), sealing took {result['seal_seconds']:.2f}s"
+    )
+    for name in ("flat", "segmented"):
+        print(
+            f"    {name:<10} written in {result[name + '_write_seconds']:6.2f}s, "
+            f"read in {result[name + '_read_seconds']:6.2f}s "
+            f"({result[name + '_read_mb_per_second']:.1f} MB/s, "
+            f"{result[name + '_read_games_per_second']} games/s)"
+        )
+
+
+# -----------------------------------PARSING-----------------------------------#
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Measure chess2lichess end to end against local stub servers"
+    )
+
+    parser.add_argument(
+        "games",
+        nargs="*",
+        type=int,
+        default=GAME_COUNTS,
+        help=f"corpus sizes to measure (default: {' '.join(map(str, GAME_COUNTS))})",
+    )
+
+    parser.add_argument(
+        "--games-per-month",
+        type=int,
+        default=GAMES_PER_MONTH,
+        help=f"games in each monthly archive (default: {GAMES_PER_MONTH})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--moves",
+        type=int,
+        default=MOVES_PER_GAME,
+        help=f"full moves in each game (default: {MOVES_PER_GAME})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--no-clocks",
+        action="store_true",
+        default=False,
+        help="leave the %%clk annotations out of the games",
+    )
+
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="answer every Nth import with a 429",
+        metavar="N",
+    )
+
+    parser.add_argument("-w", "--workers", type=int, default=4, metavar="N")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="games imported per minute at the start (default: chess2lichess's IMPORT_RATE)",
+        metavar="N",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        help="games imported per minute the rate limiter may ramp up to (default: chess2lichess's MAX_IMPORT_RATE)",
+        metavar="N",
+    )
+    parser.add_argument("--sqlite", action="store_true", default=False)
+    parser.add_argument("-j", "--json", action="store_true", default=False)
+    parser.add_argument("-p", "--pipeline", action="store_true", default=False)
+
+    parser.add_argument(
+        "--ids",
+        nargs="*",
+        type=int,
+        help=f"measure the compact ID index instead, at these history sizes (default: {' '.join(map(str, ID_COUNTS))})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--archive",
+        nargs="*",
+        type=int,
+        help=f"measure the segmented local PGN archive against the single document instead, at these corpus sizes (default: {ARCHIVE_GAMES})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--tags",
+        nargs="*",
+        type=int,
+        help=f"measure parse_tags against the regex it replaced instead, at these corpus sizes (default: {TAG_GAMES})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="also write every result, with full stage statistics, to a JSON file",
+        metavar="FILE",
+    )
+
+    # Internal: run one client against an already running stub server
+    parser.add_argument("--client", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.client:
+        options = json.loads(args.client)
+        task = run_lookups if options["task"] == "ids" else run_client
+        print(json.dumps(task(options)))
+        sys.exit(0)
+
+    results = []
+    if args.ids is not None:
+        for count in args.ids or ID_COUNTS:
+            for result in benchmark_ids(count):
+                print_id_result(result)
+                results.append(result)
+        args.games = []
+    if args.tags is not None:
+        for games in args.tags or [TAG_GAMES]:
+            result = benchmark_tags(games, args)
+            print_tag_result(result)
+            results.append(result)
+        args.games = []
+    if args.archive is not None:
+        for games in args.archive or [ARCHIVE_GAMES]:
+            result = benchmark_archive(games, args)
+            print_archive_result(result)
+            results.append(result)
+        args.games = []
+    for games in args.games:
+        result = benchmark(games, args)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,12 +1,41 @@
 import argparse
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import closing, contextmanager, nullcontext, redirect_stdout
+import copy
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import csv
-from datetime import date, datetime
+import gzip
+import hashlib
+from datetime import date, datetime, timezone
 from dateutil import tz
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain, islice
 from dateutil.relativedelta import relativedelta
+import json
+import math
+import mmap
 import os
+from queue import Empty, Full, Queue
+import random
 import re
 import requests
-from time import sleep
+import shutil
+import sqlite3
+import sys
+import tempfile
+from requests.adapters import BaseAdapter, HTTPAdapter, Retry
+from threading import Event, Lock, Thread, local
+from time import gmtime, monotonic, perf_counter, sleep, time
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where each process keeps its own rate limit
+    fcntl = None
 
 
 # -----------------------------------GLOBALS-----------------------------------#
@@ -15,115 +44,2529 @@ from time import sleep
 # LICHESS_TOKEN
 LICHESS_TOKEN = os.getenv("LICHESS_TOKEN")
 
-# Dictionary for filter game type
-TIME_CONTROL = {"rapid": "600", "blitz": "180", "bullet": "60"}
+# Base URLs for the chess.com published-data API and the lichess.org import
+# endpoint. Overridable through environment variables so the script can be
+# pointed at a local stub server.
+CHESSCOM_API = os.getenv("CHESSCOM_API", "https://api.chess.com/pub/player")
+LICHESS_IMPORT_URL = os.getenv("LICHESS_IMPORT_URL", "https://lichess.org/api/import")
+
+# Default number of months fetched concurrently in range mode
+MAX_WORKERS = 4
+
+# Default number of keep-alive connections kept open per host by the shared
+# HTTP session
+POOL_SIZE = 10
+
+# Import rates for the lichess.org rate limiter, in games per minute. Imports
+# start at IMPORT_RATE (one every 7.5 seconds) and ramp towards MAX_IMPORT_RATE
+# by IMPORT_RATE_STEP for every game lichess.org accepts. The ceiling stays
+# below the import limit simulate mode plans against, so a default run is
+# never throttled there.
+IMPORT_RATE = 8
+MAX_IMPORT_RATE = 12
+MIN_IMPORT_RATE = 1
+IMPORT_RATE_STEP = 0.5
+
+# Seconds to pause after a throttled import that follows an accepted one -
+# the halved rate is usually enough on its own. A second throttled import in
+# a row pauses for BASE_BACKOFF, doubled for every further one up to
+# MAX_BACKOFF.
+THROTTLE_PAUSE = 10
+BASE_BACKOFF = 60
+MAX_BACKOFF = 900
+
+# Attempts at importing a game while lichess.org answers with server errors
+# (5xx) before the game is given up on as rejected
+IMPORT_ATTEMPTS = 5
 
-# Creates the regex pattern used downstream to pull out the individual pieces
-# of information to store in the local "database".
-TAGS = [
-    "(?s)",
-    '(White "(?P<white>\S+)")',
-    '(Black "(?P<black>\S+)")',
-    '(UTCDate "(?P<date>\d+.\d+.\d+)")',
-    '(UTCTime "(?P<time>\d+:\d+:\d+)")',
-    '(WhiteElo "(?P<white_elo>\d+)")',
-    '(BlackElo "(?P<black_elo>\d+)")',
-    '(TimeControl "(?P<time_control>\d+[/\+\d+]{0,})")',
-    '(Termination "(?P<termination>(\S+\s){,10}\w+)")',
-    "(Link .+/(?P<game_id>\d+))",
+# Seconds to wait for a server to accept a connection, and for the next bytes
+# of a response, before giving up on a request
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+# Times a month is requested in range mode before it counts as failed, and
+# the base in seconds of the jittered exponential backoff between attempts
+FETCH_ATTEMPTS = 3
+FETCH_BACKOFF = 5
+
+# Size in bytes of the chunks read from streamed chess.com responses
+CHUNK_SIZE = 64 * 1024
+
+# Columns stored for each imported game in the local "database"
+DB_COLUMNS = [
+    "game_id",
+    "game_date",
+    "game_time",
+    "white",
+    "white_elo",
+    "black",
+    "black_elo",
+    "time_control",
+    "termination",
 ]
 
-TAG_PATTERN = re.compile(".+".join(TAGS))
+# File names of the two local "database" storage engines
+CSV_DATABASE = "pgn_database.csv"
+SQLITE_DATABASE = "pgn_database.sqlite"
+
+# Compact on-disk index of the game IDs in the .csv "database", the number of
+# IDs kept in memory before they are merged into its sorted array, and the
+# bits per ID and number of hash functions of its Bloom filter (about a 1%
+# false positive rate). The index recognises the .csv file it describes by
+# its inode and a hash of up to ID_INDEX_HEAD_SIZE bytes from its start.
+ID_INDEX = "pgn_database.ids"
+ID_INDEX_MERGE_SIZE = 65536
+ID_INDEX_HEAD_SIZE = 4096
+BLOOM_BITS_PER_ID = 10
+BLOOM_HASHES = 7
+
+# Number of rows written to SQLite per transaction
+SQLITE_BATCH_SIZE = 50
+
+# Rows/games buffered by the local files before they are written out, and the
+# longest time in seconds anything may sit in the buffer
+FLUSH_SIZE = 25
+FLUSH_INTERVAL = 30
+
+# File holding the full PGN text of every imported game, and the sidecar
+# recording where in it each game starts and how long it is
+LOCAL_PGNS = "local_pgns.txt"
+PGN_INDEX = "local_pgns.idx"
+
+# Directory of the segmented alternative to LOCAL_PGNS, with one segment per
+# player and month
+PGN_ARCHIVE = "local_pgns"
+
+# gzip level sealed segments are compressed at: level 9 saves barely 2% more
+# than 6 but compresses PGN more than twice as slowly
+ARCHIVE_COMPRESSION = 6
+
+# Directory and size limit in bytes of the on-disk cache of chess.com monthly
+# archives
+CACHE_DIR = ".chess2lichess_cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Default number of games held between two stages in pipelined mode
+QUEUE_SIZE = 100
+
+# Write-ahead journal of the imports that are in flight. Each run writes its
+# own, with its process ID inserted before the extension
+JOURNAL = "import_journal.jsonl"
+
+# How chess.com result codes describe the way the winner won, and the
+# termination of drawn games, in the wording of the PGN Termination tag
+WIN_REASONS = {
+    "checkmated": "by checkmate",
+    "resigned": "by resignation",
+    "timeout": "on time",
+    "abandoned": "- game abandoned",
+    "kingofthehill": "by king of the hill",
+    "threecheck": "by three check",
+    "bughousepartnerlose": "- partner lost",
+}
+DRAW_REASONS = {
+    "agreed": "by agreement",
+    "repetition": "by repetition",
+    "stalemate": "by stalemate",
+    "insufficient": "by insufficient material",
+    "50move": "by 50-move rule",
+    "timevsinsufficient": "by timeout vs insufficient material",
+}
+
+# High-water marks of the games already seen by watch mode, per user: the
+# month being watched and the number of its games seen, counted from the
+# start of chess.com's monthly archive
+WATCH_STATE = "watch_state.json"
+
+# Default number of seconds between polls in watch mode
+WATCH_INTERVAL = 300
+
+# Seconds after which the rate limit state shared between processes is
+# considered stale and started afresh
+SHARED_STATE_TTL = 3600
+
+# Import limit, in games per minute, of the stand-in for lichess.org used in
+# simulate mode. lichess.org does not publish the limit of its import endpoint,
+# so this is only a default to plan against - set it with --lichess-limit.
+SIMULATED_IMPORT_LIMIT = 15
+
+# Each bucket the stage timings of --report are counted in is this much wider
+# than the one before, starting from a microsecond, so reported percentiles
+# are at most 5% above the exact ones
+TIMING_BUCKET_GROWTH = 1.05
+
+# Upper bounds in seconds of the HTTP latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Dictionary for filter game type
+TIME_CONTROL = {"rapid": "600", "blitz": "180", "bullet": "60"}
+
+# Matches a single tag pair line such as [White "hikaru"] in the header
+# section of a PGN. Values keep any escaped quotes.
+TAG_PAIR_PATTERN = re.compile(r'^\[(\w+) "(.*)"\]\s*$', re.MULTILINE)
 
 # Creating variables for downstream timezone correction
 UTC_ZONE = tz.tzutc()
 LOCAL_ZONE = tz.tzlocal()
 
-# ------------------------------------CLASS------------------------------------#
+# ---------------------------------RATE LIMIT----------------------------------#
 
 
-class Chess2Lichess:
-    def __init__(self, username, verbose, convert_local) -> None:
-        self.username = username
-        self.verbose = verbose
-        self.convert_local = convert_local
+class RateLimiter:
+    """
+    Token bucket pacing the POST requests made to lichess.org. Rates are given
+    in games per minute. Every accepted import adds IMPORT_RATE_STEP to the
+    refill rate, up to max_rate; every throttled one halves it and pauses -
+    briefly for an isolated throttle, then for an exponentially growing,
+    jittered backoff while they keep coming (never shorter than Retry-After).
+    The clock and sleep functions can be swapped for a virtual clock.
+    """
 
-    def check_db_existence(self) -> None:
+    def __init__(
+        self,
+        rate=IMPORT_RATE,
+        max_rate=MAX_IMPORT_RATE,
+        min_rate=MIN_IMPORT_RATE,
+        burst=1,
+        clock=monotonic,
+        sleep=sleep,
+    ) -> None:
+        self.clock = clock
+        self.sleep = sleep
+        self.rate = rate / 60
+        self.max_rate = max_rate / 60
+        self.min_rate = min(min_rate, rate) / 60
+        self.burst = burst
+        self.tokens = burst
+        self.updated = clock()
+        self.started = self.updated
+        self.failures = 0
+        self.acquired = 0
+        self.throttles = 0
+        self.waited = 0.0
+
+    def _wait(self, seconds: float) -> None:
+        self.sleep(seconds)
+        self.waited += seconds
+
+    def acquire(self) -> None:
         """
-        Check if .csv "database" exists and creates it if not
+        Blocks until a token is available and takes it.
         """
-        if not os.path.exists("pgn_database.csv"):
-            with open("pgn_database.csv", "wt") as database:
-                print(
-                    "Created local 'database' named pgn_database.csv in the current directory"
-                )
-                writer = csv.writer(database)
-                writer.writerow(
-                    [
-                        "game_id",
-                        "game_date",
-                        "game_time",
-                        "white",
-                        "white_elo",
-                        "black",
-                        "black_elo",
-                        "time_control",
-                        "termination",
-                    ]
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self._wait((1 - self.tokens) / self.rate)
+            self.tokens = 1
+            self.updated = self.clock()
+        self.tokens -= 1
+        self.acquired += 1
+
+    @staticmethod
+    def backoff(failures: int, retry_after=None) -> float:
+        """
+        Returns the jittered number of seconds to pause after the given number
+        of throttled requests in a row.
+        """
+        if failures <= 1:
+            backoff = THROTTLE_PAUSE
+        else:
+            backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (failures - 2))
+        return max(retry_after or 0, random.uniform(backoff / 2, backoff))
+
+    def succeeded(self) -> None:
+        """
+        Records an accepted request and ramps the rate up by one step.
+        """
+        self.failures = 0
+        self.rate = min(self.max_rate, self.rate + IMPORT_RATE_STEP / 60)
+
+    def throttled(self, retry_after=None) -> float:
+        """
+        Records a throttled request, halves the rate and sleeps for the backoff
+        period. Returns the number of seconds slept.
+        """
+        self.failures += 1
+        self.throttles += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        delay = self.backoff(self.failures, retry_after)
+        self._wait(delay)
+        self.tokens = 0
+        self.updated = self.clock()
+        return delay
+
+    def summary(self, completed: int) -> str:
+        """
+        Returns a one-line report of throughput and time spent waiting.
+        """
+        elapsed = self.clock() - self.started
+        per_minute = completed / elapsed * 60 if elapsed else 0.0
+        return (
+            f"{completed} games in {elapsed:.0f}s ({per_minute:.1f} games/min), "
+            f"{self.waited:.0f}s spent waiting, {self.throttles} throttled requests"
+        )
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    Rate limiter whose bucket is shared by every process of this user that
+    imports with the same lichess.org token. The bucket lives in a small JSON
+    file in a directory only this user can open ($XDG_RUNTIME_DIR, falling
+    back to ~/.cache), named after a hash of the token and guarded by an
+    exclusive file lock, so overlapping runs split the rate between them
+    instead of each using all of it. A throttled response pauses every process.
+    """
+
+    def __init__(self, token, *args, **kwargs) -> None:
+        # Every process must read the same clock, so the default is wall time
+        kwargs.setdefault("clock", time)
+        super().__init__(*args, **kwargs)
+        digest = hashlib.sha256((token or "").encode()).hexdigest()[:16]
+        base = os.getenv("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache")
+        directory = os.path.join(base, "chess2lichess")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(directory, f"{digest}.ratelimit")
+
+    def _update(self, change):
+        """
+        Loads the shared bucket under the file lock, applies change to it and
+        stores it again. Returns whatever change returns.
+        """
+        with open(self.path, "a+", opener=lambda path, flags: os.open(path, flags, 0o600)) as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                try:
+                    state = json.load(file)
+                    if self.clock() - state["updated"] > SHARED_STATE_TTL:
+                        raise ValueError("stale rate limit state")
+                except (ValueError, KeyError):
+                    state = {
+                        "rate": self.rate,
+                        "tokens": self.burst,
+                        "updated": self.clock(),
+                        "failures": 0,
+                        "blocked_until": 0,
+                    }
+                result = change(state)
+                file.seek(0)
+                file.truncate()
+                json.dump(state, file)
+                file.flush()
+                return result
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _take(self, state) -> float:
+        """
+        Refills the shared bucket and takes a token if one is available.
+        Returns 0 on success, otherwise the number of seconds to wait.
+        """
+        now = self.clock()
+        self.rate = state["rate"]
+        state["tokens"] = min(
+            self.burst, state["tokens"] + max(0.0, now - state["updated"]) * state["rate"]
+        )
+        state["updated"] = now
+        if now < state["blocked_until"]:
+            return state["blocked_until"] - now
+        if state["tokens"] < 1:
+            return (1 - state["tokens"]) / state["rate"]
+        state["tokens"] -= 1
+        return 0
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available in the shared bucket and takes it.
+        """
+        while wait := self._update(self._take):
+            self._wait(wait)
+        self.acquired += 1
+
+    def succeeded(self) -> None:
+        """
+        Records an accepted request and ramps the shared rate up by one step.
+        """
+
+        def change(state):
+            state["failures"] = 0
+            state["rate"] = min(self.max_rate, state["rate"] + IMPORT_RATE_STEP / 60)
+
+        self._update(change)
+
+    def throttled(self, retry_after=None) -> float:
+        """
+        Records a throttled request, halves the shared rate and blocks every
+        process for the backoff period. Returns the number of seconds slept.
+        """
+
+        def change(state):
+            state["failures"] += 1
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            delay = self.backoff(state["failures"], retry_after)
+            state["blocked_until"] = max(state["blocked_until"], self.clock() + delay)
+            state["tokens"] = 0
+            return state["blocked_until"] - self.clock()
+
+        delay = self._update(change)
+        self.throttles += 1
+        self._wait(delay)
+        return delay
+
+
+def make_rate_limiter(rate, max_rate, shared=True) -> RateLimiter:
+    """
+    Returns a rate limiter shared with other processes using the same token
+    where file locking is available, and a process-local one otherwise.
+    """
+    if shared and fcntl is not None:
+        return SharedRateLimiter(LICHESS_TOKEN, rate, max_rate)
+    return RateLimiter(rate, max_rate)
+
+
+def parse_retry_after(value):
+    """
+    Converts a Retry-After header (delta seconds or HTTP date) into seconds.
+    Returns None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(when.tzinfo)).total_seconds())
+
+
+def describe_error(error: Exception) -> str:
+    """
+    Returns a short description of a failed request: its HTTP status code,
+    or the kind of error for timeouts and connection failures.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    # Server errors that outlasted the session's own retries
+    if isinstance(error, requests.exceptions.RetryError):
+        return str(error.args[0].reason)
+    return type(error).__name__
+
+
+# -------------------------------INSTRUMENTATION-------------------------------#
+
+
+class TimingHistogram:
+    """
+    The timing samples of one stage, summarised in a fixed amount of memory:
+    their count, total and maximum, and how many fell into each of a series of
+    logarithmic buckets. However long a run goes on, a stage never needs more
+    than a few hundred buckets.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = defaultdict(int)
+
+    def add(self, seconds: float) -> None:
+        """
+        Counts one sample.
+        """
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        bucket = 0 if seconds <= 1e-6 else math.ceil(math.log(seconds / 1e-6, TIMING_BUCKET_GROWTH))
+        self.buckets[bucket] += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the p-th percentile,
+        capped at the largest sample.
+        """
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        return min(self.max, 1e-6 * TIMING_BUCKET_GROWTH**bucket)
+
+
+class StageTimer:
+    """
+    Collects how long each stage of a run takes. Times are exclusive: a stage
+    timed inside another (a fetch while the splitter waits for its next chunk,
+    say) is subtracted from the outer one, so the totals add up to the time
+    actually spent. Samples are counted in a TimingHistogram per stage rather
+    than kept, so a timer can stay on for as long as watch mode runs. A
+    disabled timer records nothing and costs next to nothing.
+    """
+
+    def __init__(self, enabled=True) -> None:
+        self.enabled = enabled
+        self.samples = defaultdict(TimingHistogram)
+        self.bytes = defaultdict(int)
+        self.lock = Lock()
+        self.nested = local()
+        self.started = perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Adds one timing sample to a stage.
+        """
+        with self.lock:
+            self.samples[stage].add(seconds)
+
+    def add_bytes(self, stage: str, count: int) -> None:
+        """
+        Adds to the number of bytes a stage has transferred.
+        """
+        if self.enabled:
+            with self.lock:
+                self.bytes[stage] += count
+
+    @contextmanager
+    def _timed_block(self, stage: str):
+        outer = getattr(self.nested, "seconds", 0.0)
+        self.nested.seconds = 0.0
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.record(stage, elapsed - self.nested.seconds)
+            self.nested.seconds = outer + elapsed
+
+    def time(self, stage: str):
+        """
+        Context manager recording the time spent in a block as one sample.
+        """
+        return self._timed_block(stage) if self.enabled else _NO_TIMING
+
+    def timed(self, iterable, stage: str):
+        """
+        Wraps an iterable, recording the time spent producing its items as one
+        sample once it is exhausted.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iterable(iter(iterable), stage)
+
+    def _timed_iterable(self, iterator, stage: str):
+        total = 0.0
+        try:
+            while True:
+                outer = getattr(self.nested, "seconds", 0.0)
+                self.nested.seconds = 0.0
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = perf_counter() - start
+                    total += elapsed - self.nested.seconds
+                    self.nested.seconds = outer + elapsed
+                yield item
+        finally:
+            self.record(stage, total)
+
+    def report(self) -> dict:
+        """
+        Summarises every stage: number of samples, total and mean time,
+        percentiles (to within TIMING_BUCKET_GROWTH) and bytes transferred.
+        """
+        stages = {}
+        with self.lock:
+            for stage, samples in self.samples.items():
+                stages[stage] = {
+                    "count": samples.count,
+                    "total_seconds": round(samples.total, 6),
+                    "mean_ms": round(samples.total / samples.count * 1000, 3),
+                    "p50_ms": round(samples.percentile(50) * 1000, 3),
+                    "p90_ms": round(samples.percentile(90) * 1000, 3),
+                    "p99_ms": round(samples.percentile(99) * 1000, 3),
+                    "max_ms": round(samples.max * 1000, 3),
+                    "bytes": self.bytes.get(stage, 0),
+                }
+        return {
+            "started": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(perf_counter() - self.started, 3),
+            "stages": stages,
+        }
+
+    def write(self, path: str) -> None:
+        """
+        Writes the report to a JSON file.
+        """
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class _NoTiming:
+    """
+    Do-nothing context manager handed out by a disabled StageTimer.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMING = _NoTiming()
+
+
+class Metrics:
+    """
+    Counters and latency histograms for the HTTP traffic of a run, rendered in
+    the Prometheus text exposition format. Every response of the session is
+    counted through a requests hook, labelled with the service it came from.
+    """
+
+    HELP = {
+        "chess2lichess_http_request_duration_seconds": (
+            "histogram",
+            "Time until the response headers arrived",
+        ),
+        "chess2lichess_http_responses_total": (
+            "counter",
+            "HTTP responses by service and status code",
+        ),
+        "chess2lichess_retries_total": (
+            "counter",
+            "Requests retried after a server error or throttling",
+        ),
+        "chess2lichess_rate_limit_wait_seconds_total": (
+            "counter",
+            "Seconds spent waiting on the lichess.org rate limiter",
+        ),
+        "chess2lichess_games_imported_total": (
+            "counter",
+            "Games imported to lichess.org",
+        ),
+        "chess2lichess_games_rejected_total": (
+            "counter",
+            "Games lichess.org refused to import",
+        ),
+        "chess2lichess_hedged_requests_total": (
+            "counter",
+            "Months requested a second time because the first request was slow",
+        ),
+        "chess2lichess_failed_months_total": (
+            "counter",
+            "Months skipped because they could not be fetched",
+        ),
+    }
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name: str, amount=1, **labels) -> None:
+        """
+        Increments a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """
+        Adds an observation to a histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            buckets, total = self.histograms.get(key, ([0] * len(LATENCY_BUCKETS), [0.0, 0]))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+            total[0] += seconds
+            total[1] += 1
+            self.histograms[key] = (buckets, total)
+
+    def hook(self, response, *args, **kwargs) -> None:
+        """
+        requests response hook feeding the HTTP metrics.
+        """
+        service = "chesscom" if response.url.startswith(CHESSCOM_API) else "lichess"
+        self.observe(
+            "chess2lichess_http_request_duration_seconds",
+            response.elapsed.total_seconds(),
+            service=service,
+        )
+        self.inc(
+            "chess2lichess_http_responses_total",
+            service=service,
+            code=str(response.status_code),
+        )
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            self.inc("chess2lichess_retries_total", len(retries.history), service=service)
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text format.
+        """
+
+        def labels(pairs, extra=()):
+            pairs = list(pairs) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            for name, (kind, text) in self.HELP.items():
+                lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+                for (key, pairs), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f"{name}{labels(pairs)} {value:g}")
+                for (key, pairs), (buckets, total) in sorted(self.histograms.items()):
+                    if key != name:
+                        continue
+                    for bound, count in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{labels(pairs, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{labels(pairs, [('le', '+Inf')])} {total[1]}")
+                    lines.append(f"{name}_sum{labels(pairs)} {total[0]:g}")
+                    lines.append(f"{name}_count{labels(pairs)} {total[1]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Atomically writes the metrics to a file for the node_exporter textfile
+        collector.
+        """
+        with open(path + ".tmp", "w") as file:
+            file.write(self.render())
+        os.replace(path + ".tmp", path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """
+        Serves the metrics at http://localhost:port/metrics from a background
+        thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# ----------------------------------STREAMING----------------------------------#
+
+
+def split_pgn_stream(chunks):
+    """
+    Splits an iterable of text chunks from a multi-game PGN body into single
+    games, yielded one at a time. Games are separated by two blank lines, so
+    only the game currently being read is ever buffered.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *games, buffer = buffer.split("\n\n\n")
+        for game in games:
+            if game.strip():
+                yield game
+    if buffer.strip():
+        yield buffer.rstrip()
+
+
+class _StageFailed:
+    """
+    Carries an exception raised inside a pipeline stage over to the consumer.
+    """
+
+    def __init__(self, error) -> None:
+        self.error = error
+
+
+_STAGE_DONE = object()
+
+
+def pipelined(iterable, maxsize=QUEUE_SIZE):
+    """
+    Runs an iterable in a background thread, handing its items over through a
+    bounded queue. The producer keeps working while the consumer is busy but
+    never gets more than maxsize items ahead of it. Exceptions raised by the
+    producer are re-raised in the consumer, and the producer stops as soon as
+    the consumer goes away.
+    """
+    queue = Queue(maxsize)
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(_StageFailed(error))
+        put(_STAGE_DONE)
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageFailed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def with_last(iterable):
+    """
+    Yields (item, is_last) pairs, looking one item ahead of the consumer.
+    """
+    iterator = iter(iterable)
+    try:
+        previous = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield previous, False
+        previous = item
+    yield previous, True
+
+
+# -----------------------------------JOURNAL-----------------------------------#
+
+
+class ImportJournal:
+    """
+    Write-ahead journal of the games being imported, one JSON entry per line.
+    A "posting" entry is synced before a game is sent to lichess.org and a
+    "posted" entry, holding the PGN, once lichess.org has accepted it. After
+    the local files are flushed, checkpoint() rewrites the journal down to the
+    accepted games that still haven't been recorded, so after a crash
+    recover() can record exactly those without posting them again. Games
+    lichess.org refused to import get a "rejected" entry, which is kept for
+    good so they aren't posted again on every run.
+
+    Every run writes its own journal, named after its process ID, and holds
+    an exclusive lock on it for as long as the file exists. Runs sharing a
+    working directory therefore never overwrite each other's entries, and
+    recover() only adopts the journals nobody holds, which were left behind
+    by runs that have ended. Without fcntl (on Windows) nothing is locked and
+    every journal found is adopted.
+    """
+
+    def __init__(self, path=JOURNAL, run=None) -> None:
+        self.base, self.extension = os.path.splitext(path)
+        self.path = f"{self.base}.{os.getpid() if run is None else run}{self.extension}"
+        self.unrecorded = {}
+        self.rejects = {}
+        self.file = None
+        # Journals of ended runs, kept locked until checkpoint() removes them
+        self.adopted = []
+
+    @staticmethod
+    def _lock(file, blocking=True) -> bool:
+        """
+        Takes an exclusive lock on an open journal, held until it is closed.
+        Returns False if another run holds it and blocking is False.
+        """
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    @staticmethod
+    def _is_current(file, path: str) -> bool:
+        """
+        Checks that an open journal is still the file at path, i.e. that it
+        hasn't been replaced or removed since it was opened.
+        """
+        try:
+            return os.fstat(file.fileno()).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _append(self, entry: dict) -> None:
+        while self.file is None:
+            file = open(self.path, "a")
+            self._lock(file)
+            if self._is_current(file, self.path):
+                self.file = file
+            else:
+                file.close()
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _journals(self) -> list:
+        """
+        Returns the paths of every run's journal in the directory.
+        """
+        directory, prefix = os.path.split(self.base + ".")
+        paths = []
+        for name in os.listdir(directory or "."):
+            run = name[len(prefix) : len(name) - len(self.extension)]
+            if name.startswith(prefix) and name.endswith(self.extension) and run.isdigit():
+                paths.append(os.path.join(directory, name))
+        return sorted(paths)
+
+    def recover(self) -> list:
+        """
+        Reads the journals left behind by runs that were interrupted. Returns
+        the "posted" entries that were never recorded, in order, and the
+        number of games whose POST may or may not have reached lichess.org.
+        Games rejected by earlier runs are remembered in rejects. The adopted
+        journals stay locked, so no other run recovers them too, and are
+        removed at the next checkpoint.
+        """
+        posted = {}
+        posting = set()
+        for path in self._journals():
+            try:
+                # An ended run may have had this run's process ID, in which
+                # case its journal becomes this run's own
+                file = open(path, "a+" if path == self.path else "r")
+            except FileNotFoundError:
+                continue
+            if not self._lock(file, blocking=False) or not self._is_current(file, path):
+                # Still being written by another run, or already adopted
+                file.close()
+                continue
+            file.seek(0)
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    continue
+                if entry["state"] == "posting":
+                    posting.add(entry["game_id"])
+                elif entry["state"] == "rejected":
+                    self.rejects[entry["game_id"]] = entry
+                else:
+                    posted[entry["game_id"]] = entry
+            if path == self.path:
+                self.file = file
+            else:
+                self.adopted.append((path, file))
+        return list(posted.values()), len(posting - set(posted) - set(self.rejects))
+
+    def posting(self, game_id: str) -> None:
+        """
+        Records that a game is about to be posted.
+        """
+        self._append({"state": "posting", "game_id": game_id})
+
+    def posted(self, game_id: str, pgn: str, last: bool) -> None:
+        """
+        Records that lichess.org accepted a game.
+        """
+        entry = {"state": "posted", "game_id": game_id, "pgn": pgn, "last": last}
+        self._append(entry)
+        self.unrecorded[game_id] = entry
+
+    def rejected(self, game_id: str, reason: str) -> None:
+        """
+        Records that lichess.org refused to import a game.
+        """
+        entry = {"state": "rejected", "game_id": game_id, "reason": reason}
+        self._append(entry)
+        self.rejects[game_id] = entry
+
+    def recorded(self, game_id: str) -> None:
+        """
+        Notes that a game has been handed to the local files. It is only
+        dropped from the journal at the next checkpoint, after those files
+        have been flushed.
+        """
+        self.unrecorded.pop(game_id, None)
+
+    def checkpoint(self) -> None:
+        """
+        Atomically rewrites this run's journal so it only holds the accepted
+        games that have not been recorded and the rejected ones, then removes
+        the journals adopted by recover(). The new journal is locked before it
+        replaces the old one, so it is never left unlocked while this run is
+        going. Must only be called right after the local files have been
+        flushed.
+        """
+        if not self.unrecorded and not self.rejects:
+            file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        else:
+            file = open(self.path + ".tmp", "w")
+            self._lock(file)
+            for entry in chain(self.rejects.values(), self.unrecorded.values()):
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+            os.replace(self.path + ".tmp", self.path)
+        if self.file is not None:
+            self.file.close()
+        self.file = file
+        for path, adopted in self.adopted:
+            if self._is_current(adopted, path):
+                os.remove(path)
+            adopted.close()
+        self.adopted = []
+
+
+# ------------------------------------CACHE------------------------------------#
+
+
+class ArchiveCache:
+    """
+    On-disk cache of chess.com monthly archives keyed by username, year, month
+    and kind ("pgn" or "json" for the two endpoints). Each entry is the
+    response body plus a small .meta file holding its ETag and Last-Modified
+    headers. Once the cache grows past max_bytes the least recently used
+    entries are evicted.
+    """
+
+    KINDS = ("pgn", "json")
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username: str, year: int, month: int, kind: str) -> str:
+        return os.path.join(
+            self.directory, f"{username.lower()}_{year}{month:02d}.{kind}"
+        )
+
+    def lookup(self, username: str, year: int, month: int, kind="pgn"):
+        """
+        Returns the stored validators of a cached month as a dict, or None if
+        the month is not cached.
+        """
+        path = self._path(username, year, month, kind)
+        try:
+            with open(path + ".meta", "r") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(path) else None
+
+    def read(self, username: str, year: int, month: int, kind="pgn"):
+        """
+        Yields the cached body of a month in CHUNK_SIZE pieces and marks the
+        entry as recently used.
+        """
+        path = self._path(username, year, month, kind)
+        os.utime(path)
+        with open(path, "r", encoding="utf-8") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                yield chunk
+
+    def _write_meta(self, path: str, meta: dict) -> None:
+        with open(path + ".meta.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(path + ".meta.tmp", path + ".meta")
+
+    def seal(self, username: str, year: int, month: int, kind="pgn") -> None:
+        """
+        Marks a cached month as closed once it has been revalidated after the
+        month ended, so it is served from disk from then on.
+        """
+        path = self._path(username, year, month, kind)
+        meta = self.lookup(username, year, month, kind)
+        if meta is not None:
+            self._write_meta(path, dict(meta, closed=True))
+
+    def store(self, username: str, year: int, month: int, kind: str, chunks, headers):
+        """
+        Passes chunks of a response body through while writing them to the
+        cache. The entry is only committed once the whole body has been read,
+        and only counts as closed if the month was already over when fetched.
+        """
+        path = self._path(username, year, month, kind)
+        partial = f"{path}.{os.getpid()}.{id(chunks)}.part"
+        complete = False
+        try:
+            with open(partial, "w", encoding="utf-8") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                os.replace(partial, path)
+                self._write_meta(
+                    path,
+                    {
+                        "etag": headers.get("ETag"),
+                        "last_modified": headers.get("Last-Modified"),
+                        "closed": is_closed_month(year, month),
+                    },
                 )
+                self.evict()
+            elif os.path.exists(partial):
+                os.remove(partial)
+
+    def evict(self) -> None:
+        """
+        Removes least recently used months until the cache fits in max_bytes.
+        """
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.rsplit(".", 1)[-1] in self.KINDS:
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for suffix in ("", ".meta"):
+                    try:
+                        os.remove(os.path.join(self.directory, name + suffix))
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+    def count(self, outcome: str) -> None:
+        """
+        Records a cache hit, revalidation or miss.
+        """
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def summary(self) -> str:
+        """
+        Returns a one-line hit/miss report.
+        """
+        return (
+            f"{self.hits} served from disk, {self.revalidated} revalidated, "
+            f"{self.misses} downloaded"
+        )
+
+
+def is_closed_month(year: int, month: int) -> bool:
+    """
+    Checks whether a month is over (with a day of grace for games finishing
+    around midnight UTC), after which its chess.com archive no longer changes.
+    """
+    closes = date(year, month, 1) + relativedelta(months=1, days=1)
+    return closes <= datetime.now(timezone.utc).date()
+
+
+# ---------------------------------TAG PARSING---------------------------------#
+
+
+class GameTags(NamedTuple):
+    """
+    The tags of a single game stored in the local "database", plus every tag
+    pair found in the header section. Missing tags are None.
+    """
+
+    game_id: str
+    date: str
+    time: str
+    white: str
+    white_elo: str
+    black: str
+    black_elo: str
+    time_control: str
+    termination: str
+    headers: dict
+
+
+def parse_tags(pgn: str) -> GameTags:
+    """
+    Parses the tag pair section of a single PGN in one pass. The move text
+    after the first blank line is never scanned, and tags may appear in any
+    order.
+    """
+    end = pgn.find("\n\n")
+    headers = dict(TAG_PAIR_PATTERN.findall(pgn if end == -1 else pgn[:end]))
+    link = headers.get("Link")
+    return GameTags(
+        game_id=link.rstrip("/").rsplit("/", 1)[-1] if link else None,
+        date=headers.get("UTCDate"),
+        time=headers.get("UTCTime"),
+        white=headers.get("White"),
+        white_elo=headers.get("WhiteElo"),
+        black=headers.get("Black"),
+        black_elo=headers.get("BlackElo"),
+        time_control=headers.get("TimeControl"),
+        termination=headers.get("Termination"),
+        headers=headers,
+    )
+
+
+def tags_from_json(entry: dict) -> GameTags:
+    """
+    Builds the tags of a game from an entry of the chess.com JSON monthly
+    endpoint. The endpoint has no start time for live games, so the UTC date
+    and time are taken from start_time when present and end_time otherwise.
+    """
+    white, black = entry["white"], entry["black"]
+    played = gmtime(entry.get("start_time") or entry["end_time"])
+    if white["result"] == "win":
+        termination = f"{white['username']} won {WIN_REASONS.get(black['result'], 'by ' + black['result'])}"
+    elif black["result"] == "win":
+        termination = f"{black['username']} won {WIN_REASONS.get(white['result'], 'by ' + white['result'])}"
+    else:
+        termination = f"Game drawn {DRAW_REASONS.get(white['result'], 'by ' + white['result'])}"
+    return GameTags(
+        game_id=entry["url"].rstrip("/").rsplit("/", 1)[-1],
+        date=f"{played.tm_year}.{played.tm_mon:02d}.{played.tm_mday:02d}",
+        time=f"{played.tm_hour:02d}:{played.tm_min:02d}:{played.tm_sec:02d}",
+        white=white["username"],
+        white_elo=str(white["rating"]),
+        black=black["username"],
+        black_elo=str(black["rating"]),
+        time_control=entry["time_control"],
+        termination=termination,
+        headers={},
+    )
+
+
+class Game(NamedTuple):
+    """
+    A single game as it moves through the pipeline: the raw PGN text together
+    with its tags, parsed once when the game is fetched.
+    """
+
+    pgn: str
+    tags: GameTags
+
+
+# ----------------------------------DATABASE-----------------------------------#
+
+
+class Buffered:
+    """
+    Base of the local files that collect writes in memory and hand them to
+    the OS every flush_size writes or flush_interval seconds, whichever comes
+    first, and on close. Subclasses implement flush() and call _flushed() at
+    the end of it.
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL) -> None:
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = 0
+        self.flushed = monotonic()
+
+    def _buffered(self) -> None:
+        """
+        Counts a buffered write, flushing if either threshold has been reached.
+        """
+        self.pending += 1
+        if (
+            self.pending >= self.flush_size
+            or monotonic() - self.flushed >= self.flush_interval
+        ):
+            self.flush()
+
+    def _flushed(self) -> None:
+        """
+        Restarts both thresholds after a flush.
+        """
+        self.pending = 0
+        self.flushed = monotonic()
+
+    def flush(self) -> None:
+        raise NotImplementedError
+
+
+class BufferedFile(Buffered):
+    """
+    Append-only text file kept open for the whole run, buffered as described
+    in Buffered.
+    """
+
+    def __init__(self, path, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL) -> None:
+        super().__init__(flush_size, flush_interval)
+        self.path = path
+        self.buffer = []
+        self.file = None
+
+    def write(self, text: str) -> None:
+        """
+        Buffers text, flushing if either threshold has been reached.
+        """
+        self.buffer.append(text)
+        self._buffered()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered text to the file in a single call.
+        """
+        if self.buffer:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write("".join(self.buffer))
+            self.file.flush()
+            self.buffer.clear()
+        self._flushed()
+
+    def close(self) -> None:
+        """
+        Flushes the buffer and closes the file.
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class IdIndex:
+    """
+    Compact on-disk index of the game IDs in the .csv "database", for import
+    histories too big to hold in a set. chess.com's numeric game IDs are
+    packed into a sorted array of 64-bit integers that is memory-mapped and
+    binary searched, so a lookup only reads the pages it touches. IDs added
+    since the array was last rewritten are appended to a log and kept in a
+    small set until merge_size of them have built up. An optional Bloom filter
+    in front answers most lookups of games not yet imported without touching
+    the array at all. A JSON sidecar records which .csv file the index
+    describes and how much of it the index covers; rows beyond that are
+    indexed when it is opened, and a different or truncated file has the
+    index rebuilt from scratch.
+    """
+
+    def __init__(self, path=ID_INDEX, bloom=False, merge_size=ID_INDEX_MERGE_SIZE) -> None:
+        self.path = path
+        self.log_path = path + ".log"
+        self.bloom_path = path + ".bloom"
+        self.meta_path = path + ".json"
+        self.csv_path = None
+        self.use_bloom = bloom
+        self.merge_size = merge_size
+        self.meta = {"covers": 0, "count": 0, "bloom_capacity": 0}
+        self.lock = Lock()
+        self.map = None
+        self.ids = memoryview(b"").cast("Q")
+        self.bloom_map = None
+        self.bloom = None
+        self.bloom_bits = 0
+        self.recent = set()
+        self.unlogged = []
+
+    @staticmethod
+    def key(game_id: str) -> int:
+        """
+        Packs a game ID into an unsigned 64-bit integer. IDs that aren't plain
+        numbers are hashed instead.
+        """
+        if game_id.isdigit() and len(game_id) < 20:
+            return int(game_id)
+        return int.from_bytes(hashlib.blake2b(game_id.encode(), digest_size=8).digest(), "little")
+
+    def fingerprint(self, covers: int):
+        """
+        Identifies the .csv "database" by its inode and a hash of its first
+        bytes, up to covers of them. Returns None if the file is shorter than
+        covers, as it can't be the file the index was built from.
+        """
+        if os.path.getsize(self.csv_path) < covers:
+            return None
+        with open(self.csv_path, "rb") as file:
+            head = file.read(min(covers, ID_INDEX_HEAD_SIZE))
+        return [os.stat(self.csv_path).st_ino, hashlib.sha256(head).hexdigest()]
+
+    def open(self, csv_path: str) -> None:
+        """
+        Maps the index files, then indexes any rows of the .csv "database"
+        that were written after the index was last checkpointed - all of
+        them the first time, or if the .csv file has been replaced since.
+        """
+        self.csv_path = csv_path
+        try:
+            with open(self.meta_path, "r") as file:
+                self.meta = json.load(file)
+        except (OSError, ValueError):
+            self.meta = {}
+        if self.meta.get("csv") != self.fingerprint(self.meta.get("covers", 0)):
+            # No index yet, or one of a .csv file that has since been replaced
+            # or truncated: start from scratch
+            if "csv" in self.meta:
+                print(f"{csv_path} has changed since {self.path} was built - rebuilding it")
+            self.meta = {"covers": 0, "count": 0, "bloom_capacity": 0}
+            for path in (self.path, self.log_path, self.bloom_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        if not self.use_bloom and os.path.exists(self.bloom_path):
+            # It would miss the IDs added while it isn't kept up to date
+            os.remove(self.bloom_path)
+            self.meta["bloom_capacity"] = 0
+        self._map()
+        if os.path.exists(self.log_path):
+            log = array("Q")
+            with open(self.log_path, "rb") as file:
+                log.frombytes(file.read())
+            self.recent.update(log)
+            # In case the filter's pages never made it to disk
+            if self.bloom is not None:
+                for key in self.recent:
+                    self._bloom_add(key)
+
+        covers = self.meta["covers"]
+        indexed = 0
+        with open(csv_path, "rb") as file:
+            file.seek(covers)
+            lines = (line.decode("utf-8") for line in file)
+            if covers == 0:
+                next(lines, None)
+            for row in csv.reader(lines):
+                if row:
+                    self.add(row[0])
+                    indexed += 1
+                    # Bigger batches mean fewer rewrites of the whole array
+                    if len(self.recent) >= 16 * self.merge_size:
+                        self.merge()
+        if indexed > self.merge_size:
+            print(f"Indexed {indexed} game IDs from {csv_path} into {self.path}")
+        self.checkpoint(os.path.getsize(csv_path))
+
+    def _map(self) -> None:
+        """
+        Memory-maps the sorted ID array and, if there is one, the Bloom filter.
+        """
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, "rb") as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.ids = memoryview(self.map).cast("Q")
+        if self.use_bloom and os.path.exists(self.bloom_path):
+            with open(self.bloom_path, "r+b") as file:
+                self.bloom_map = mmap.mmap(file.fileno(), 0)
+            self.bloom = memoryview(self.bloom_map)
+            self.bloom_bits = len(self.bloom) * 8
+
+    def _unmap(self) -> None:
+        """
+        Releases the memory maps so the files can be replaced.
+        """
+        self.ids.release()
+        self.ids = memoryview(b"").cast("Q")
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.bloom is not None:
+            self.bloom.release()
+            self.bloom_map.close()
+            self.bloom = self.bloom_map = None
+
+    def _probes(self, key: int):
+        """
+        Yields the Bloom filter bit positions of a key, derived from two
+        halves of its splitmix64 hash. Lazily, as a lookup of a missing ID
+        usually stops at the first or second bit.
+        """
+        z = (key + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        z ^= z >> 31
+        h1, h2 = z & 0xFFFFFFFF, (z >> 32) | 1
+        for i in range(BLOOM_HASHES):
+            yield (h1 + i * h2) % self.bloom_bits
+
+    def _build_bloom(self) -> None:
+        """
+        Writes a new Bloom filter sized for twice the current number of IDs,
+        so it is only rebuilt each time the index doubles. Until the first
+        checkpoint after opening, lookups go straight to the array.
+        """
+        if self.bloom is not None:
+            self.bloom.release()
+            self.bloom_map.close()
+        capacity = max(2 * (len(self.ids) + len(self.recent)), self.merge_size)
+        size = math.ceil(capacity * BLOOM_BITS_PER_ID / 8)
+        with open(self.bloom_path, "w+b") as file:
+            file.truncate(size)
+            self.bloom_map = mmap.mmap(file.fileno(), 0)
+        self.bloom = memoryview(self.bloom_map)
+        self.bloom_bits = size * 8
+        for key in chain(self.ids, self.recent):
+            self._bloom_add(key)
+        self.meta["bloom_capacity"] = capacity
+
+    def _bloom_add(self, key: int) -> None:
+        """
+        Sets the Bloom filter bits of a key.
+        """
+        for bit in self._probes(key):
+            self.bloom[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, game_id: str) -> bool:
+        """
+        Checks whether a game ID is in the index.
+        """
+        key = self.key(game_id)
+        with self.lock:
+            if self.bloom is not None:
+                for bit in self._probes(key):
+                    if not self.bloom[bit >> 3] & (1 << (bit & 7)):
+                        return False
+            if key in self.recent:
+                return True
+            position = bisect_left(self.ids, key)
+            return position < len(self.ids) and self.ids[position] == key
+
+    def add(self, game_id: str) -> None:
+        """
+        Adds a game ID to the index. It is written to disk at the next
+        checkpoint.
+        """
+        key = self.key(game_id)
+        with self.lock:
+            self.recent.add(key)
+            self.unlogged.append(key)
+            if self.bloom is not None:
+                self._bloom_add(key)
+
+    def merge(self) -> None:
+        """
+        Rewrites the sorted array with the recently added IDs merged in. Only
+        the recent IDs are handled one by one; the runs of the old array
+        between them are copied straight from the memory map.
+        """
+        start = 0
+        with open(self.path + ".tmp", "wb") as file:
+            for key in sorted(self.recent):
+                position = bisect_left(self.ids, key, start)
+                file.write(self.ids[start:position])
+                if position < len(self.ids) and self.ids[position] == key:
+                    start = position
+                    continue
+                file.write(key.to_bytes(8, sys.byteorder))
+                start = position
+            file.write(self.ids[start:])
+        self._unmap()
+        os.replace(self.path + ".tmp", self.path)
+        open(self.log_path, "wb").close()
+        self.recent.clear()
+        self.unlogged.clear()
+        self._map()
+        self.meta["count"] = len(self.ids)
+
+    def checkpoint(self, covers: int) -> None:
+        """
+        Appends the IDs added since the last checkpoint to the log, merging
+        once enough have built up, and records that the index now covers the
+        first covers bytes of the .csv "database".
+        """
+        with self.lock:
+            if self.unlogged:
+                with open(self.log_path, "ab") as file:
+                    array("Q", self.unlogged).tofile(file)
+                self.unlogged.clear()
+            if len(self.recent) >= self.merge_size:
+                self.merge()
+            if self.use_bloom and (
+                self.bloom is None
+                or self.meta["bloom_capacity"] < len(self.ids) + len(self.recent)
+            ):
+                self._build_bloom()
+            if self.bloom_map is not None:
+                self.bloom_map.flush()
+            self.meta["covers"] = covers
+            self.meta["csv"] = self.fingerprint(covers)
+            with open(self.meta_path + ".tmp", "w") as file:
+                json.dump(self.meta, file)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    def close(self) -> None:
+        """
+        Releases the memory maps.
+        """
+        with self.lock:
+            self._unmap()
+
+
+class CsvDatabase:
+    """
+    The original .csv "database". The imported game IDs are read into a set
+    the first time they are needed and kept in step with every added row, or
+    looked up in an IdIndex if one is given.
+    """
+
+    def __init__(self, path=CSV_DATABASE, index=None) -> None:
+        self.path = path
+        self.index = index
+        self.ids = None
+        self.lock = Lock()
+        self.file = BufferedFile(path)
+        self.writer = csv.writer(self.file)
+
+    def create(self) -> None:
+        """
+        Check if .csv "database" exists and creates it if not
+        """
+        if not os.path.exists(self.path):
+            with open(self.path, "wt") as database:
+                print(
+                    f"Created local 'database' named {self.path} in the current directory"
+                )
+                writer = csv.writer(database)
+                writer.writerow(DB_COLUMNS)
+        if self.index is not None:
+            self.index.open(self.path)
+
+    def load_ids(self) -> set:
+        """
+        Reads the game IDs in the .csv "database" into a set, so checking a
+        fetched game against the whole import history is a constant-time lookup.
+        """
+        with open(self.path, "r") as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            return {row[0] for row in reader if row}
+
+    def is_imported(self, game_id: str) -> bool:
+        """
+        Checks whether a game ID is already in the .csv "database".
+        """
+        if self.index is not None:
+            return game_id in self.index
+        if self.ids is None:
+            with self.lock:
+                if self.ids is None:
+                    self.ids = self.load_ids()
+        return game_id in self.ids
+
+    def add(self, row: list) -> None:
+        """
+        Appends one row to the .csv "database" through the write buffer.
+        """
+        self.writer.writerow(row)
+        if self.index is not None:
+            self.index.add(row[0])
+        elif self.ids is not None:
+            self.ids.add(row[0])
+
+    def flush(self) -> None:
+        """
+        Writes out any buffered rows, then checkpoints the ID index.
+        """
+        self.file.flush()
+        if self.index is not None:
+            self.index.checkpoint(os.path.getsize(self.path))
+
+    def close(self) -> None:
+        """
+        Writes out any buffered rows and closes the file and the ID index.
+        """
+        self.file.close()
+        if self.index is not None:
+            self.index.checkpoint(os.path.getsize(self.path))
+            self.index.close()
+
+
+class SqliteDatabase:
+    """
+    SQLite "database" with game_id as primary key and indexes on the columns
+    worth querying. Dedup is an indexed lookup and rows are committed in
+    batches of batch_size. Runs in WAL mode so readers never block the import.
+    """
+
+    def __init__(self, path=SQLITE_DATABASE, batch_size=SQLITE_BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.lock = Lock()
+        self.connection = None
+
+    def create(self) -> None:
+        """
+        Opens the SQLite "database", creating the schema if needed. A new
+        database is seeded once from an existing .csv "database".
+        """
+        existed = os.path.exists(self.path)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY,
+                game_date TEXT,
+                game_time TEXT,
+                white TEXT,
+                white_elo INTEGER,
+                black TEXT,
+                black_elo INTEGER,
+                time_control TEXT,
+                termination TEXT
+            );
+            CREATE INDEX IF NOT EXISTS games_date ON games (game_date, game_time);
+            CREATE INDEX IF NOT EXISTS games_time_control ON games (time_control);
+            CREATE INDEX IF NOT EXISTS games_white ON games (white);
+            CREATE INDEX IF NOT EXISTS games_black ON games (black);
+            """
+        )
+        if not existed:
+            print(f"Created local 'database' named {self.path} in the current directory")
+            if os.path.exists(CSV_DATABASE):
+                self.migrate(CSV_DATABASE)
+
+    def migrate(self, csv_path: str) -> None:
+        """
+        Copies every row of a .csv "database" into SQLite in one transaction.
+        """
+        with open(csv_path, "r") as file, self.connection:
+            reader = csv.reader(file)
+            next(reader, None)
+            cursor = self.connection.executemany(
+                f"INSERT OR IGNORE INTO games VALUES ({', '.join('?' * len(DB_COLUMNS))})",
+                (row for row in reader if row),
+            )
+        print(f"Migrated {cursor.rowcount} games from {csv_path} to {self.path}")
+
+    def is_imported(self, game_id: str) -> bool:
+        """
+        Looks a game ID up through the primary key index.
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT 1 FROM games WHERE game_id = ?", (game_id,)
+            )
+            return cursor.fetchone() is not None
+
+    def add(self, row: list) -> None:
+        """
+        Inserts one row, committing once batch_size rows are pending.
+        """
+        with self.lock:
+            self.connection.execute(
+                f"INSERT OR IGNORE INTO games VALUES ({', '.join('?' * len(DB_COLUMNS))})",
+                row,
+            )
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.connection.commit()
+                self.pending = 0
+
+    def flush(self) -> None:
+        """
+        Commits any pending rows.
+        """
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        """
+        Commits any pending rows and closes the connection.
+        """
+        if self.connection is not None:
+            with self.lock:
+                self.connection.commit()
+                self.connection.close()
+                self.connection = None
+
+
+# ---------------------------------LOCAL PGNS----------------------------------#
+
+
+class LocalPgns(Buffered):
+    """
+    The local PGN text document holding the full text of every imported game,
+    buffered like a BufferedFile. Next to it, a .csv sidecar records the byte
+    offset and length of each game, so any game can be read back by its ID
+    straight out of a memory map instead of by scanning the whole document.
+    Games written without the sidecar - by older versions, or before it
+    existed - are indexed the next time the document is opened.
+    """
+
+    def __init__(
+        self,
+        path=LOCAL_PGNS,
+        index_path=PGN_INDEX,
+        flush_size=FLUSH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+    ) -> None:
+        super().__init__(flush_size, flush_interval)
+        self.path = path
+        self.index_path = index_path
+        self.buffer = []
+        self.file = None
+        self.index_file = None
+        self.offsets = None
+        self.map = None
+
+    def write(self, pgn: str, game_id=None, separator="\n\n\n") -> None:
+        """
+        Buffers a game and the separator after it, flushing if either
+        threshold has been reached.
+        """
+        self.buffer.append((game_id, pgn, separator))
+        self._buffered()
+
+    def _open(self) -> None:
+        """
+        Opens the document and the sidecar for appending, indexing any games
+        the sidecar doesn't cover yet.
+        """
+        self.file = open(self.path, "ab")
+        self.index_file = open(self.index_path, "a")
+        self.index()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered games to the document in a single call, then
+        their offsets to the sidecar, so the sidecar never points past the
+        end of the document.
+        """
+        if self.buffer:
+            if self.file is None:
+                self._open()
+            position = self.file.seek(0, os.SEEK_END)
+            data = []
+            rows = []
+            for game_id, pgn, separator in self.buffer:
+                text = pgn.encode("utf-8")
+                if game_id:
+                    rows.append(f"{game_id},{position},{len(text)}\n")
+                    if self.offsets is not None:
+                        self.offsets[game_id] = (position, len(text))
+                data.append(text + separator.encode("utf-8"))
+                position += len(data[-1])
+            self.file.write(b"".join(data))
+            self.file.flush()
+            self.index_file.write("".join(rows))
+            self.index_file.flush()
+            self.buffer.clear()
+        self._flushed()
+
+    def close(self) -> None:
+        """
+        Flushes the buffer and closes the files and memory map.
+        """
+        self.flush()
+        for file in (self.file, self.index_file, self.map):
+            if file is not None:
+                file.close()
+        self.file = self.index_file = self.map = None
+
+    def indexed_to(self) -> int:
+        """
+        Returns the offset just past the last game in the sidecar, or 0 if
+        there is no sidecar yet.
+        """
+        try:
+            with open(self.index_path, "rb") as file:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(0, size - 4096))
+                lines = file.read().splitlines()
+            _, offset, length = lines[-1].decode().split(",")
+            return int(offset) + int(length)
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def scan(self, offset=0):
+        """
+        Reads the document from offset on and yields (game_id, offset, length)
+        for every game in it. A game starts at a tag pair line that follows a
+        blank line and some move text, so games separated by one blank line
+        or two are both found.
+        """
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            position = offset
+            start = end = None
+            blank = True
+            in_moves = False
+            headers = []
+
+            def finish():
+                tags = parse_tags(b"".join(headers).decode("utf-8", "replace"))
+                return tags.game_id, start, end - start
+
+            for line in file:
+                text = line.strip()
+                if text.startswith(b"[") and blank and (start is None or in_moves):
+                    if start is not None:
+                        yield finish()
+                    start = position
+                    headers = []
+                    in_moves = False
+                if text and start is not None:
+                    end = position + len(line.rstrip(b"\r\n"))
+                    if text.startswith(b"[") and not in_moves:
+                        headers.append(line)
+                    else:
+                        in_moves = True
+                blank = not text
+                position += len(line)
+            if start is not None:
+                yield finish()
+
+    def index(self, rebuild=False) -> int:
+        """
+        Adds the games past the end of the sidecar to it - every game the
+        first time, or when rebuilding. Returns the number of games indexed.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        if rebuild and os.path.exists(self.index_path):
+            if self.index_file is not None:
+                self.index_file.close()
+                self.index_file = None
+            os.remove(self.index_path)
+        rows = [
+            f"{game_id},{offset},{length}\n"
+            for game_id, offset, length in self.scan(self.indexed_to())
+            if game_id
+        ]
+        if rows:
+            if self.index_file is not None:
+                self.index_file.write("".join(rows))
+                self.index_file.flush()
+            else:
+                with open(self.index_path, "a") as file:
+                    file.write("".join(rows))
+            print(f"Indexed {len(rows)} games in {self.path}")
+        return len(rows)
+
+    def load_offsets(self) -> dict:
+        """
+        Reads the sidecar into a dictionary of game ID to (offset, length).
+        A game imported more than once is found at its latest copy. There is
+        no sidecar if the document holds no games with an ID yet.
+        """
+        self.index()
+        offsets = {}
+        try:
+            with open(self.index_path, "r") as file:
+                for row in csv.reader(file):
+                    if len(row) == 3:
+                        offsets[row[0]] = (int(row[1]), int(row[2]))
+        except FileNotFoundError:
+            pass
+        return offsets
+
+    def lookup(self, game_id: str):
+        """
+        Returns the PGN of an imported game, read through a memory map of the
+        document, or None if it isn't in the document.
+        """
+        self.flush()
+        if self.offsets is None:
+            self.offsets = self.load_offsets() if os.path.exists(self.path) else {}
+        if game_id not in self.offsets:
+            return None
+        offset, length = self.offsets[game_id]
+        if self.map is None or len(self.map) < offset + length:
+            if self.map is not None:
+                self.map.close()
+            with open(self.path, "rb") as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset : offset + length].decode("utf-8")
+
+
+class SegmentedArchive(Buffered):
+    """
+    Alternative to the single local PGN text document: one segment per player
+    and month in a directory, so the archive no longer grows as one file.
+    Segments of months still in progress are plain text and appended to
+    cheaply; once a month is over its segment is sealed, compressed with gzip
+    in one go. The odd game added to a sealed month is appended as an extra
+    gzip member. A manifest keeps the number of games, the raw and stored
+    sizes and a SHA-256 checksum of every segment.
+    """
+
+    def __init__(
+        self, directory=PGN_ARCHIVE, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL
+    ) -> None:
+        super().__init__(flush_size, flush_interval)
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.buffer = defaultdict(list)
+        self.manifest = None
+        self.touched = set()
+
+    @staticmethod
+    def segment(username, date) -> str:
+        """
+        Returns the name of the segment for a player's game played on date,
+        given as YYYY.MM.DD.
+        """
+        month = date.replace(".", "")[:6] if date else "unknown"
+        return f"{(username or 'unknown').lower()}_{month}"
+
+    def _path(self, name: str) -> str:
+        sealed = self._manifest().get(name, {}).get("sealed")
+        return os.path.join(self.directory, f"{name}.pgn" + (".gz" if sealed else ""))
+
+    def _manifest(self) -> dict:
+        """
+        Returns the manifest, reading it the first time it is needed.
+        """
+        if self.manifest is None:
+            try:
+                with open(self.manifest_path, "r") as file:
+                    self.manifest = json.load(file)
+            except (OSError, ValueError):
+                self.manifest = {}
+            for name, entry in self.manifest.items():
+                self._reconcile(name, entry)
+        return self.manifest
+
+    def _reconcile(self, name: str, entry: dict) -> None:
+        """
+        Brings a segment's manifest entry back in line with its files after a
+        crash part-way through sealing it. The plain text segment is only
+        removed once the manifest says the segment is sealed, so a plain
+        segment next to an unsealed entry is always the complete one.
+        """
+        plain = os.path.join(self.directory, f"{name}.pgn")
+        if entry["sealed"]:
+            if os.path.exists(plain) and os.path.exists(plain + ".gz"):
+                os.remove(plain)
+        elif os.path.exists(plain) and os.path.exists(plain + ".gz"):
+            os.remove(plain + ".gz")
+
+    def _write_manifest(self) -> None:
+        """
+        Atomically stores the manifest.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w") as file:
+            json.dump(self._manifest(), file, indent=1, sort_keys=True)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def write(self, pgn: str, username=None, date=None) -> None:
+        """
+        Buffers a game for the segment of its player and month (YYYY.MM.DD),
+        flushing if either threshold has been reached. Games within a segment
+        are always separated by two blank lines.
+        """
+        self.buffer[self.segment(username, date)].append(pgn + "\n\n\n")
+        self._buffered()
+
+    def flush(self) -> None:
+        """
+        Appends the buffered games to their segments, one write per segment,
+        and updates the manifest.
+        """
+        if self.pending:
+            os.makedirs(self.directory, exist_ok=True)
+            manifest = self._manifest()
+            for name, games in self.buffer.items():
+                entry = manifest.setdefault(
+                    name,
+                    {"games": 0, "bytes": 0, "stored_bytes": 0, "sha256": None, "sealed": False},
+                )
+                data = "".join(games).encode("utf-8")
+                path = self._path(name)
+                with open(path, "ab") as file:
+                    file.write(gzip.compress(data, ARCHIVE_COMPRESSION) if entry["sealed"] else data)
+                entry["games"] += len(games)
+                entry["bytes"] += len(data)
+                entry["stored_bytes"] = os.path.getsize(path)
+                # Brought up to date when the archive is closed
+                entry["sha256"] = None
+                self.touched.add(name)
+            self._write_manifest()
+            self.buffer.clear()
+        self._flushed()
+
+    def checksum(self, name: str) -> str:
+        """
+        Returns the SHA-256 checksum of a segment as stored.
+        """
+        digest = hashlib.sha256()
+        with open(self._path(name), "rb") as file:
+            for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def seal(self, name: str) -> None:
+        """
+        Compresses the plain text segment of a month that is over into a
+        single gzip member and marks it sealed in the manifest. The plain text
+        is only removed once the manifest pointing at the compressed copy has
+        been stored, so a crash at any point leaves one complete segment.
+        """
+        entry = self._manifest()[name]
+        plain = self._path(name)
+        with open(plain, "rb") as source, gzip.open(plain + ".gz.tmp", "wb", ARCHIVE_COMPRESSION) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(plain + ".gz.tmp", plain + ".gz")
+        entry["sealed"] = True
+        entry["stored_bytes"] = os.path.getsize(plain + ".gz")
+        entry["sha256"] = self.checksum(name)
+        self.touched.discard(name)
+        self._write_manifest()
+        os.remove(plain)
+
+    def close(self) -> None:
+        """
+        Flushes the buffer, seals every segment whose month is over - including
+        ones written to by earlier runs while the month was still going - and
+        brings the checksums of the segments that changed up to date.
+        """
+        self.flush()
+        for name, entry in self._manifest().items():
+            month = name.rsplit("_", 1)[-1]
+            if (
+                not entry["sealed"]
+                and month.isdigit()
+                and is_closed_month(int(month[:4]), int(month[4:]))
+            ):
+                self.seal(name)
+        if not self.touched:
+            return
+        for name in self.touched:
+            self._manifest()[name]["sha256"] = self.checksum(name)
+        self.touched.clear()
+        self._write_manifest()
+
+    def segments(self, username=None, month=None) -> list:
+        """
+        Returns the names of the segments of a player (all players if None)
+        and month (given as YYYY/MM; all months if None), oldest first.
+        """
+        names = sorted(self._manifest())
+        if username:
+            names = [n for n in names if n.rsplit("_", 1)[0] == username.lower()]
+        if month:
+            names = [n for n in names if n.rsplit("_", 1)[-1] == month.replace("/", "")]
+        return names
+
+    def read(self, username=None, month=None):
+        """
+        Streams the games of the matching segments, decompressing sealed ones
+        on the fly, so only one game is held in memory at a time.
+        """
+        for name in self.segments(username, month):
+            path = self._path(name)
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8") as file:
+                yield from split_pgn_stream(iter(lambda: file.read(CHUNK_SIZE), ""))
+
+    def verify(self) -> list:
+        """
+        Returns the names of segments that are missing or don't match the
+        checksum in the manifest.
+        """
+        bad = []
+        for name, entry in self._manifest().items():
+            if not os.path.exists(self._path(name)):
+                bad.append(name)
+            elif entry["sha256"] and self.checksum(name) != entry["sha256"]:
+                bad.append(name)
+        return bad
+
+    def summary(self) -> str:
+        """
+        Returns a one-line report of the size of the archive.
+        """
+        entries = self._manifest().values()
+        raw = sum(e["bytes"] for e in entries)
+        stored = sum(e["stored_bytes"] for e in entries)
+        sealed = sum(1 for e in entries if e["sealed"])
+        ratio = raw / stored if stored else 0.0
+        return (
+            f"{sum(e['games'] for e in entries)} games in {len(entries)} segments "
+            f"({sealed} sealed), {raw / 2**20:.1f} MB stored in {stored / 2**20:.1f} MB "
+            f"({ratio:.1f}x)"
+        )
+
+
+# ------------------------------------CLASS------------------------------------#
+
+
+class Chess2Lichess:
+    def __init__(
+        self,
+        username,
+        verbose,
+        convert_local,
+        max_workers=MAX_WORKERS,
+        pool_size=POOL_SIZE,
+        rate_limiter=None,
+        database=None,
+        local_pgns=None,
+        cache=None,
+        journal=None,
+        source="pgn",
+        stats=None,
+        metrics=None,
+        metrics_file=None,
+        sleep=sleep,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        fetch_attempts=FETCH_ATTEMPTS,
+        hedge_after=None,
+        keep_going=False,
+    ) -> None:
+        self.username = username
+        self.verbose = verbose
+        self.convert_local = convert_local
+        self.max_workers = max_workers
+        self.session = self.build_session(max(pool_size, max_workers))
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.database = database or CsvDatabase()
+        self.local_pgns = local_pgns or LocalPgns()
+        self.cache = cache
+        self.journal = journal or ImportJournal()
+        self.source = source
+        self.stats = stats or StageTimer(enabled=False)
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.sleep = sleep
+        self.timeout = timeout
+        self.fetch_attempts = max(1, fetch_attempts)
+        self.hedge_after = hedge_after
+        # Hedged requests run in their own pool so a month's second request
+        # never waits behind the range workers that are waiting on it
+        self.hedger = ThreadPoolExecutor(max_workers=2 * max_workers) if hedge_after else None
+        self.keep_going = keep_going
+        self.failed_months = []
+        self.failed_users = []
+        self.rejected = []
+        if metrics:
+            self.session.hooks["response"].append(metrics.hook)
+        self.imported = 0
+        self.filtered_out = 0
+        self.requested = 0
+        self.already_imported = 0
+        self.previously_rejected = 0
+
+    def build_session(self, pool_size: int) -> requests.Session:
+        """
+        Creates the keep-alive session shared by every chess.com and lichess.org
+        call in the run. Idempotent GETs are retried with exponential backoff on
+        connection errors, timeouts, throttling and server errors, honouring
+        Retry-After; import POSTs are never retried here so a game can't be
+        posted twice.
+        """
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def connection_stats(self) -> tuple:
+        """
+        Returns a tuple of (connections opened, requests that reused an already
+        open connection) summed over every host the session has talked to.
+        """
+        opened = 0
+        sent = 0
+        adapters = {id(a): a for a in self.session.adapters.values()}.values()
+        for adapter in adapters:
+            # Adapters that don't go over the network have no pools
+            if not isinstance(adapter, HTTPAdapter):
+                continue
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return opened, sent - opened
+
+    def check_db_existence(self) -> None:
+        """
+        Check if the local "database" exists and creates it if not, then
+        finish recording any games an interrupted run left in the journal.
+        """
+        self.database.create()
+        self.resume_journal()
+
+    def resume_journal(self) -> None:
+        """
+        Records the games that lichess.org accepted during an interrupted run
+        but that never made it into the local files. Games whose POST was cut
+        off are not in the "database", so they are simply imported again.
+        """
+        entries, uncertain = self.journal.recover()
+        recovered = 0
+        for entry in entries:
+            if not self.database.is_imported(entry["game_id"]):
+                game = Game(entry["pgn"], parse_tags(entry["pgn"]))
+                self.update_db(game)
+                self.update_local_pgns(
+                    game.pgn, last=entry["last"], game_id=entry["game_id"], date=game.tags.date
+                )
+                recovered += 1
+        if recovered:
+            print(f"Recorded {recovered} games imported by an interrupted run")
+        if uncertain and self.verbose:
+            print(f"{uncertain} games from an interrupted run will be posted again")
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes out the local "database" and PGN text document, then trims the
+        journal down to whatever is still unrecorded.
+        """
+        with self.stats.time("flush"):
+            self.database.flush()
+            self.local_pgns.flush()
+            self.journal.checkpoint()
+        if self.metrics and self.metrics_file:
+            self.metrics.write(self.metrics_file)
+
+    def close(self) -> None:
+        """
+        Writes out anything still buffered for the local "database" and PGN
+        text document and closes the HTTP session. Called on every exit,
+        including Ctrl-C.
+        """
+        self.flush()
+        self.database.close()
+        self.local_pgns.close()
+        if self.hedger:
+            self.hedger.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def convert_utc_to_local(self, date, time):
+        """
+        Takes in the UTC date and time as written in the PGN text fetched from the
+        chess.com server, returns a tuple of date and time as string with the
+        formatting (YYYY/MM/DD, HH:MM:SS).
+        """
+        utc = datetime.strptime(f"{date} {time}", "%Y.%m.%d %H:%M:%S")
+        utc = utc.replace(tzinfo=UTC_ZONE)
+        local = utc.astimezone(LOCAL_ZONE)
+        date, time = datetime.strftime(local, "%Y/%m/%d %H:%M:%S").split()
+        return date, time
+
+    def fetch_current_month(self):
+        """
+        Uses the requests library to fetch the raw multi-game PGN text for
+        games played in the month that the script is being run in. Yields a
+        Game for each one as it is downloaded.
+        """
+        return self.fetch_month(f"{datetime.today():%Y/%m}")
+
+    def fetch_month(self, date: str):
+        """
+        Uses the requests library to fetch the raw multi-game PGN text for
+        games played in the specified month. Yields a Game for each one as it
+        is downloaded.
+        """
+        year, month = date.split("/")
+        return self._stream_month(int(year), int(month))
+
+    def _stream_month(self, year: int, month: int):
+        """
+        Streams the multi-game PGN text for a single month from chess.com,
+        yielding one Game at a time without holding the full body in memory.
+        """
+        if self.source == "json":
+            yield from self._json_month(year, month)
+            return
+        headers = {
+            "content_type": "application/x-chess-pgn",
+            "Content-Disposition": f'attachment; filename="ChessCom_{self.username}_{year}{month:02d}.pgn"',
+        }
+        body = self.stats.timed(self._month_body(year, month, "pgn", headers), "fetch_month")
+        yield from self._split_games(body)
+
+    def _json_month(self, year: int, month: int):
+        """
+        Fetches a month from the structured JSON endpoint and yields a Game for
+        each entry, built from the JSON fields without scanning PGN headers.
+        """
+        body = "".join(
+            self.stats.timed(self._month_body(year, month, "json", {}), "fetch_month")
+        )
+        with self.stats.time("parse"):
+            entries = json.loads(body)["games"] if body else []
+        for entry in entries:
+            with self.stats.time("parse"):
+                game = Game(entry["pgn"].rstrip("\n"), tags_from_json(entry))
+            yield game
+
+    def _month_body(self, year: int, month: int, kind: str, headers: dict):
+        """
+        Yields the body of a monthly archive from the "pgn" or "json" endpoint
+        in text chunks. Months cached after they closed are read from disk;
+        anything else in the cache is revalidated with a conditional request.
+        """
+        url = f"{CHESSCOM_API}/{self.username}/games/{year}/{month:02d}"
+        if kind == "pgn":
+            url += "/pgn"
+        cached = self.cache.lookup(self.username, year, month, kind) if self.cache else None
+        if cached is not None and cached.get("closed"):
+            self.cache.count("hits")
+            yield from self.cache.read(self.username, year, month, kind)
+            return
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        with self.session.get(
+            url=url, headers=headers, stream=True, timeout=self.timeout
+        ) as response:
+            not_modified = response.status_code == 304 and cached is not None
+            if not_modified:
+                self.cache.count("revalidated")
+                if is_closed_month(year, month):
+                    self.cache.seal(self.username, year, month, kind)
+                chunks = self.cache.read(self.username, year, month, kind)
+            else:
+                response.raise_for_status()
+                response.encoding = response.encoding or "utf-8"
+                chunks = response.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=True)
+                if self.cache:
+                    self.cache.count("misses")
+                    chunks = self.cache.store(
+                        self.username, year, month, kind, chunks, response.headers
+                    )
+            yield from chunks
+            if not not_modified:
+                self.stats.add_bytes("fetch_month", response.raw.tell())
+
+    def _split_games(self, chunks):
+        """
+        Splits streamed PGN text into games and parses each one's tags.
+        """
+        for pgn in self.stats.timed(split_pgn_stream(chunks), "split"):
+            with self.stats.time("parse"):
+                game = Game(pgn, parse_tags(pgn))
+            yield game
+
+    def _month_games(self, m: date, cancelled=None):
+        """
+        Downloads every game for a single month given as a date object. Gives
+        up, closing the connection, as soon as cancelled is set and returns
+        None.
+        """
+        games = []
+        with closing(self._stream_month(m.year, m.month)) as stream:
+            for game in stream:
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                games.append(game)
+        return games
 
-    def convert_utc_to_local(self, date, time):
+    def _hedged_month_games(self, m: date) -> list:
         """
-        Takes in the UTC date and time as written in the PGN text fetched from the
-        chess.com server, returns a tuple of date and time as string with the
-        formatting (YYYY/MM/DD, HH:MM:SS).
+        Downloads a month, requesting it a second time if the first request
+        hasn't finished after hedge_after seconds. Whichever copy arrives
+        first is used and the other one is abandoned.
         """
-        utc = datetime.strptime(f"{date} {time}", "%Y.%m.%d %H:%M:%S")
-        utc = utc.replace(tzinfo=UTC_ZONE)
-        local = utc.astimezone(LOCAL_ZONE)
-        date, time = datetime.strftime(local, "%Y/%m/%d %H:%M:%S").split()
-        return date, time
+        cancelled = Event()
+        first = self.hedger.submit(self._month_games, m, cancelled)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        if self.verbose:
+            print(f"{m:%Y/%m} is slow to download - requesting it again")
+        if self.metrics:
+            self.metrics.inc("chess2lichess_hedged_requests_total")
+        pending = {first, self.hedger.submit(self._month_games, m, cancelled)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+            # Both requests failed
+            return first.result()
+        finally:
+            cancelled.set()
 
-    def fetch_current_month(self) -> list:
+    def _fetch_month_games(self, m: date) -> list:
         """
-        Uses the requests library to fetch the raw multi-game PGN text for
-        games played in the month that the script is being run in. Returns a UTF-8
-        encoded string.
+        Downloads every game for a single month given as a date object, hedged
+        if requested. Failed downloads, including ones cut off part way
+        through, are tried again after a jittered exponential backoff, up to
+        fetch_attempts times in all. Used by the worker threads in fetch_range.
         """
-        url = f"https://api.chess.com/pub/player/{self.username}/games/{(today:=datetime.today()):%Y}/{today:%m}/pgn"
-        headers = {
-            "content_type": "application/x-chess-pgn",
-            "Content-Disposition": f'attachment; filename="ChessCom_{self.username}_{today:%Y%m}.pgn"',
-        }
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        pgns = response.text
-        pgn_list = pgns.split("\n\n\n")
-        return pgn_list
+        for attempt in range(1, self.fetch_attempts + 1):
+            try:
+                if self.hedger:
+                    return self._hedged_month_games(m)
+                return self._month_games(m)
+            except requests.exceptions.RequestException as error:
+                status = getattr(error.response, "status_code", None)
+                # Missing months and bad usernames won't fix themselves
+                if attempt == self.fetch_attempts or (
+                    status is not None and status < 500 and status != 429
+                ):
+                    raise
+                delay = random.uniform(0.5, 1) * FETCH_BACKOFF * 2 ** (attempt - 1)
+                print(
+                    f"Fetching {m:%Y/%m} failed ({describe_error(error)}) - trying again in {delay:.0f} seconds"
+                )
+                if self.metrics:
+                    self.metrics.inc("chess2lichess_retries_total", service="chesscom")
+                self.sleep(delay)
 
-    def fetch_month(self, date: str) -> list:
+    def fetch_archives(self):
         """
-        Uses the requests library to fetch the raw multi-game PGN text for
-        games played in the specified month. Returns a UTF-8 encoded string.
+        Fetches the list of months in which the player has games on chess.com.
+        Returns a set of (year, month) tuples, or None if the list could not
+        be fetched, in which case every month in a range is requested.
         """
-        year, month = date.split("/")
-        url = (
-            f"https://api.chess.com/pub/player/{self.username}/games/{year}/{month}/pgn"
-        )
-        headers = {
-            "content_type": "application/x-chess-pgn",
-            "Content-Disposition": f'attachment; filename="ChessCom_{self.username}_{year}{month}.pgn"',
-        }
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        pgns = response.text
-        pgn_list = pgns.split("\n\n\n")
-        return pgn_list
+        url = f"{CHESSCOM_API}/{self.username}/games/archives"
+        try:
+            response = self.session.get(url=url, timeout=self.timeout)
+            response.raise_for_status()
+            archives = response.json()["archives"]
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            print("Could not fetch the list of monthly archives - requesting every month")
+            return None
+        months = set()
+        for archive in archives:
+            year, month = archive.rstrip("/").split("/")[-2:]
+            months.add((int(year), int(month)))
+        return months
 
-    def fetch_range(self, start_in: str, end_in: str) -> list:
+    def fetch_range(self, start_in: str, end_in: str):
         """
         Uses the requests library to fetch the raw multi-game PGN text for
-        games played in the specified month. Returns a UTF-8 encoded string.
+        games played in the specified range of months. Up to max_workers months
+        are downloaded at once and yielded game by game in chronological order.
         """
         month_list = []
 
@@ -135,151 +2578,604 @@ class Chess2Lichess:
             month_list.append(start)
             start += relativedelta(months=1)
 
-        pgn_accumulator = ""
-        for m in month_list:
-            url = f"https://api.chess.com/pub/player/{self.username}/games/{m.year}/{m.month:02d}/pgn"
-            headers = {
-                "content_type": "application/x-chess-pgn",
-                "Content-Disposition": f'attachment; filename="ChessCom_{self.username}_{m.year}{m.month:02d}.pgn"',
-            }
-            response = requests.get(url=url, headers=headers)
-            response.raise_for_status()
-            pgn_accumulator += response.text.rstrip()
-            pgn_accumulator += "\n\n\n"
+        # Skip the months in which the player has no games at all
+        archives = self.fetch_archives()
+        if archives is not None:
+            requested = len(month_list)
+            month_list = [m for m in month_list if (m.year, m.month) in archives]
+            if self.verbose:
+                print(
+                    f"{len(month_list)} of the {requested} months in the range have games - saved {requested - len(month_list)} requests"
+                )
+
+        # Only max_workers months are in flight or waiting to be consumed at
+        # any time, so memory stays flat however long the range is. Futures
+        # are consumed in submission order to keep the games chronological.
+        months = iter(month_list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque(
+                (m, executor.submit(self._fetch_month_games, m))
+                for m in islice(months, self.max_workers)
+            )
+            while pending:
+                m, future = pending.popleft()
+                for n in islice(months, 1):
+                    pending.append((n, executor.submit(self._fetch_month_games, n)))
+                try:
+                    games = future.result()
+                except requests.exceptions.RequestException as error:
+                    if not self.keep_going:
+                        raise
+                    # Carry on with the rest of the range
+                    self.failed_months.append((self.username, f"{m:%Y/%m}", describe_error(error)))
+                    if self.metrics:
+                        self.metrics.inc("chess2lichess_failed_months_total")
+                    print(f"Could not fetch {m:%Y/%m} ({describe_error(error)}) - skipping it")
+                    continue
+                yield from games
+
+    def report_failed_months(self) -> None:
+        """
+        Lists the months skipped in keep-going mode, which can be imported
+        later with -m once chess.com serves them again.
+        """
+        if self.failed_months:
+            print(f"{len(self.failed_months)} months could not be fetched and were skipped:")
+            for username, month, reason in self.failed_months:
+                print(f"  {username} {month}: {reason}")
+
+    def report_failed_users(self) -> None:
+        """
+        Lists the users whose games could not be fetched in batch mode, such
+        as misspelt usernames, while everyone else's were imported.
+        """
+        if self.failed_users:
+            print(f"{len(self.failed_users)} users' games could not be fetched:")
+            for username, reason in self.failed_users:
+                print(f"  {username}: {reason}")
+
+    def report_rejected(self) -> None:
+        """
+        Lists the games lichess.org refused to import during this run. They
+        are remembered in the journal and not posted again.
+        """
+        if self.rejected:
+            print(f"{len(self.rejected)} games were rejected by lichess.org:")
+            for username, game_id, reason in self.rejected:
+                print(f"  {username} {game_id}: {reason}")
+
+    def load_watermark(self) -> dict:
+        """
+        Returns the watch mode high-water mark for this user: the month being
+        watched and how many of its games have been seen. The mark is a
+        position in the monthly archive, not a game ID or time, which holds
+        because chess.com only ever appends to an archive.
+        """
+        try:
+            with open(WATCH_STATE, "r") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+        return state.get(self.username.lower(), {"month": None, "seen": 0})
+
+    def save_watermark(self, watermark: dict) -> None:
+        """
+        Atomically stores the watch mode high-water mark for this user.
+        """
+        try:
+            with open(WATCH_STATE, "r") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+        state[self.username.lower()] = watermark
+        with open(WATCH_STATE + ".tmp", "w") as file:
+            json.dump(state, file)
+        os.replace(WATCH_STATE + ".tmp", WATCH_STATE)
 
-        pgn_list = pgn_accumulator.rstrip("\n\n\n").split("\n\n\n")
+    def _new_games_in_month(self, year: int, month: int, seen: int) -> list:
+        """
+        Returns the games of a month past the first seen ones. chess.com only
+        ever appends to a monthly archive, so earlier games are split off but
+        never parsed. An unchanged archive (HTTP 304) is still split from the
+        cache: it may have been cached by a run that never imported it all.
+        """
+        if self.source == "json":
+            return list(self._json_month(year, month))[seen:]
+        body = self._month_body(year, month, "pgn", {})
+        new = []
+        for index, pgn in enumerate(split_pgn_stream(body)):
+            if index >= seen:
+                new.append(Game(pgn, parse_tags(pgn)))
+        return new
+
+    def poll_new_games(self, watermark: dict) -> list:
+        """
+        Fetches the games played since the high-water mark was last moved,
+        finishing off the previous month first when the month has rolled over.
+        Updates the watermark in place.
+        """
+        now = datetime.now(timezone.utc)
+        current = f"{now:%Y/%m}"
+        games = []
+        if watermark["month"] not in (None, current):
+            year, month = watermark["month"].split("/")
+            games += self._new_games_in_month(int(year), int(month), watermark["seen"])
+            watermark.update(month=current, seen=0)
+        if watermark["month"] is None:
+            watermark["month"] = current
+        new = self._new_games_in_month(now.year, now.month, watermark["seen"])
+        watermark["seen"] += len(new)
+        games += new
+        return games
 
-        return pgn_list
+    def watch(self, interval=WATCH_INTERVAL, game_types=None) -> None:
+        """
+        Polls the current month every interval seconds and imports new games
+        as they appear, until interrupted. Only games beyond the stored
+        high-water mark are parsed; the duplicate check still guards against
+        importing anything twice. A poll that fails part way - chess.com or
+        lichess.org unreachable, say - leaves the high-water mark where it was
+        and is tried again after the interval. Only authentication errors
+        stop watching.
+        """
+        watermark = self.load_watermark()
+        print(f"Watching {self.username}'s games - polling every {interval} seconds")
+        try:
+            while True:
+                polled = dict(watermark)
+                try:
+                    games = self.poll_new_games(polled)
+                    if games:
+                        self.requested = self.filtered_out = self.already_imported = 0
+                        self.previously_rejected = 0
+                        if game_types:
+                            games = self.filter_pgns(games, game_types)
+                        self.import_pgns(self.check_already_imported(games))
+                    elif self.verbose:
+                        print(f"No new games at {datetime.now():%H:%M:%S}")
+                    watermark = polled
+                except requests.exceptions.RequestException as error:
+                    if getattr(error.response, "status_code", None) in (401, 403):
+                        raise
+                    print(
+                        f"Polling failed at {datetime.now():%H:%M:%S} ({describe_error(error)}) - trying again in {interval} seconds"
+                    )
+                self.flush()
+                self.save_watermark(watermark)
+                self.sleep(interval)
+        except KeyboardInterrupt:
+            print(f"Stopped watching {self.username}'s games")
 
-    def filter_pgns(self, pgn_list: list, game_types: str) -> list:
+    def filter_pgns(self, games, game_types: str):
         """
-        Filters PGNs fetched from chess.com based on time control.
+        Filters games fetched from chess.com based on time control. Yields the
+        games that pass the filter.
         """
         if self.verbose:
             print(f"Filtering to only include {', '.join(game_types)} games...")
-        tc_pattern = re.compile(r"TimeControl \"(\d+[\+\d+]{0,3})\"")
         durations = [TIME_CONTROL[gt] for gt in game_types]
-        filtered_pgn_list = []
-        for pgn in pgn_list:
-            if re.search(tc_pattern, pgn).group(1).split("+")[0] in durations:
-                filtered_pgn_list.append(pgn)
-        if not filtered_pgn_list:
-            print("There are no games that pass your filter!")
-            exit(1)
-        else:
-            return filtered_pgn_list
+        for game in games:
+            with self.stats.time("filter_pgns"):
+                time_control = game.tags.time_control or ""
+                passed = time_control.split("+")[0] in durations
+            if passed:
+                yield game
+            else:
+                self.filtered_out += 1
 
-    def check_already_imported(self, fetched_pgns: list) -> list:
+    def check_already_imported(self, games):
         """
-        Check local monthly PGN text document to see which games have already
-        been imported. Return a sanitized list of PGNs that have not yet been
-        imported.
+        Check local "database" to see which games have already been imported.
+        Yields the games that have not yet been imported, leaving out any that
+        lichess.org has rejected before.
         """
-        with open("pgn_database.csv", "r+") as file:
-            reader = csv.reader(file)
-            current_ids = [row[0] for row in reader]
-        print(f"{len(fetched_pgns)} games requested for import")
-        if len(current_ids) > 1:
-            unseen_pgns = [
-                pgn
-                for pgn in fetched_pgns
-                if re.search(TAG_PATTERN, pgn).group("game_id") not in current_ids
-            ]
-            dont_import = len(fetched_pgns) - len(unseen_pgns)
-        else:
-            unseen_pgns = fetched_pgns
-            dont_import = 0
-        if not unseen_pgns:
-            print("All requested games have already been imported!")
-            exit(1)
-        else:
-            if self.verbose:
-                print(
-                    f"{dont_import} of the {len(fetched_pgns)} requested games have already been imported"
-                )
-            return unseen_pgns
+        for game in games:
+            self.requested += 1
+            with self.stats.time("check_already_imported"):
+                seen = self.database.is_imported(game.tags.game_id)
+            if seen:
+                self.already_imported += 1
+            elif game.tags.game_id in self.journal.rejects:
+                self.previously_rejected += 1
+            else:
+                yield game
 
-    def update_db(self, pgn) -> None:
+    def update_db(self, game: Game) -> None:
         """
-        Update the local .csv "database" with PGN tags for each game being imported.
+        Update the local "database" with PGN tags for each game being imported.
         """
-        with open("pgn_database.csv", "a+") as database:
-            writer = csv.writer(database)
-            tags = re.search(TAG_PATTERN, pgn)
-            game_id = tags.group("game_id")
-            if self.convert_local:
-                game_date, game_time = self.convert_utc_to_local(
-                    tags.group("date"), tags.group("time")
-                )
-            else:
-                game_date, game_time = (tags.group("date"), tags.group("time"))
-            white = tags.group("white")
-            white_elo = tags.group("white_elo")
-            black_elo = tags.group("black_elo")
-            black = tags.group("black")
-            time_control = tags.group("time_control")
-            termination = tags.group("termination")
-
-            writer.writerow(
-                [
-                    game_id,
-                    game_date,
-                    game_time,
-                    white,
-                    white_elo,
-                    black,
-                    black_elo,
-                    time_control,
-                    termination,
-                ]
-            )
+        tags = game.tags
+        if self.convert_local:
+            game_date, game_time = self.convert_utc_to_local(tags.date, tags.time)
+        else:
+            game_date, game_time = (tags.date, tags.time)
+        self.database.add(
+            [
+                tags.game_id,
+                game_date,
+                game_time,
+                tags.white,
+                tags.white_elo,
+                tags.black,
+                tags.black_elo,
+                tags.time_control,
+                tags.termination,
+            ]
+        )
 
-    def update_local_pgns(self, pgn, last=False) -> None:
+    def update_local_pgns(self, pgn, last=False, game_id=None, date=None) -> None:
         """
         Update the local PGN text document with each game being imported.
         """
-        with open("local_pgns.txt", "a+") as file:
-            if not last:
-                file.write(pgn + "\n\n\n")
-            else:
-                file.write(pgn + "\n\n")
+        if isinstance(self.local_pgns, SegmentedArchive):
+            self.local_pgns.write(pgn, self.username, date)
+        else:
+            separator = "\n\n" if last else "\n\n\n"
+            self.local_pgns.write(pgn, game_id, separator)
 
-    def import_pgns(self, pgn_list: list) -> None:
+    def import_game(self, game: Game, last=False) -> bool:
         """
-        Uses the requests library to post the PGN text to the lichess.org server,
-        imports it into your profile.
+        Posts a single game to lichess.org through the rate limiter, retrying
+        it while lichess.org is throttling, then records it locally. A game
+        lichess.org refuses (any other 4xx status, or IMPORT_ATTEMPTS server
+        errors in a row) is logged and marked rejected in the journal instead;
+        only authentication errors stop the run. Returns whether the game was
+        imported.
         """
-        url = "https://lichess.org/api/import"
         headers = {
             "content_type": "application/x-www-form-urlencoded",
             "Authorization": f"Bearer {LICHESS_TOKEN}",
         }
-        n_games = len(pgn_list)
+        data = {"pgn": game.pgn}
+        self.journal.posting(game.tags.game_id)
+        waited = self.rate_limiter.waited
+        server_errors = 0
+        while True:
+            with self.stats.time("rate_limit_wait"):
+                self.rate_limiter.acquire()
+            with self.stats.time("post"):
+                response = self.session.post(
+                    url=LICHESS_IMPORT_URL, headers=headers, data=data, timeout=self.timeout
+                )
+            self.stats.add_bytes("post", len(response.request.body or ""))
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            server_errors = server_errors + 1 if response.status_code >= 500 else 0
+            if server_errors >= IMPORT_ATTEMPTS:
+                break
+            with self.stats.time("throttle_wait"):
+                delay = self.rate_limiter.throttled(
+                    parse_retry_after(response.headers.get("Retry-After"))
+                )
+            if self.metrics:
+                self.metrics.inc("chess2lichess_retries_total", service="lichess")
+            print(
+                f"lichess.org returned {response.status_code} - paused imports for {delay:.0f} seconds"
+            )
+        if self.metrics:
+            self.metrics.inc(
+                "chess2lichess_rate_limit_wait_seconds_total",
+                self.rate_limiter.waited - waited,
+            )
+        if response.status_code in (401, 403):
+            response.raise_for_status()
+        if response.status_code >= 400:
+            reason = f"HTTP {response.status_code}"
+            if response.status_code >= 500:
+                reason += f" on {server_errors} attempts in a row"
+            try:
+                error = response.json().get("error")
+            except (ValueError, AttributeError):
+                error = None
+            if error:
+                reason += f" - {error}"
+            self.journal.rejected(game.tags.game_id, reason)
+            self.rejected.append((self.username, game.tags.game_id, reason))
+            if self.metrics:
+                self.metrics.inc("chess2lichess_games_rejected_total")
+            print(f"lichess.org rejected game {game.tags.game_id} ({reason}) - skipping it")
+            return False
+        self.journal.posted(game.tags.game_id, game.pgn, last)
+        self.rate_limiter.succeeded()
+        with self.stats.time("update_db"):
+            self.update_db(game)
+        with self.stats.time("update_local_pgns"):
+            self.update_local_pgns(
+                game.pgn, last=last, game_id=game.tags.game_id, date=game.tags.date
+            )
+        self.journal.recorded(game.tags.game_id)
+        if self.metrics:
+            self.metrics.inc("chess2lichess_games_imported_total")
+        return True
+
+    def import_pgns(self, games) -> int:
+        """
+        Uses the requests library to post the PGN text to the lichess.org server,
+        imports it into your profile. Games are imported as soon as the upstream
+        stages yield them. Returns the number of games imported.
+        """
         games_imported = 0
         if self.verbose:
-            print(f"There are {len(pgn_list)} games to import")
             print("Importing games from chess.com...")
-        for pgn in pgn_list:
-            data = {"pgn": pgn}
-            try:
-                requests.post(url=url, headers=headers, data=data)
-                games_imported += 1
-            except requests.exceptions.HTTPError:
-                print("Too many requests - pausing imports for one minute")
-                sleep(60)
-                requests.post(url=url, headers=headers, data=data)
-                games_imported += 1
-            self.update_db(pgn)
-            if pgn != pgn_list[-1]:
-                self.update_local_pgns(pgn)
-            else:
-                self.update_local_pgns(pgn, last=True)
+        for game, last in with_last(games):
+            if not self.import_game(game, last):
+                continue
+            games_imported += 1
+            if games_imported % FLUSH_SIZE == 0:
+                self.flush()
             if self.verbose:
-                print(f"Imported {games_imported}/{n_games}")
-            if games_imported != n_games:
-                sleep(7.5)
+                print(f"Imported {games_imported}")
+        print(f"{self.requested} games requested for import")
         if self.verbose:
-            print("Finished importing games from chess.com")
+            print(
+                f"{self.already_imported} of the {self.requested} requested games have already been imported"
+            )
+            if self.previously_rejected:
+                print(
+                    f"{self.previously_rejected} requested games were rejected by lichess.org before and were skipped"
+                )
+            if games_imported:
+                print("Finished importing games from chess.com")
+                print(f"Imported {self.rate_limiter.summary(games_imported)}")
+            self.report_http()
+        return games_imported
+
+    def report_http(self) -> None:
+        """
+        Prints connection reuse and archive cache statistics.
+        """
+        opened, reused = self.connection_stats()
+        print(f"HTTP connections: {opened} opened, {reused} reused")
+        if self.cache:
+            print(f"Monthly archives: {self.cache.summary()}")
+
+    def for_user(self, username: str) -> "Chess2Lichess":
+        """
+        Returns a client for another chess.com user that shares this one's
+        HTTP session, rate limiter, cache, journal and local files.
+        """
+        client = copy.copy(self)
+        client.username = username
+        client.filtered_out = 0
+        client.requested = 0
+        client.already_imported = 0
+        client.previously_rejected = 0
+        client.imported = 0
+        return client
+
+
+# ------------------------------------BATCH------------------------------------#
+
+
+def read_usernames(path: str) -> list:
+    """
+    Reads chess.com usernames from a file, one per line. Blank lines and lines
+    starting with # are ignored.
+    """
+    with open(path, "r") as file:
+        return [
+            line.strip()
+            for line in file
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def import_round_robin(streams: dict, verbose=False) -> int:
+    """
+    Imports the games of several users through their shared rate limiter,
+    taking one game from each user in turn so no user waits behind another's
+    whole backlog. streams maps each user's client to the iterable of games to
+    import; they are typically pipelined so every user's archives are fetched
+    concurrently. A user whose games can't be fetched is recorded in
+    failed_users and dropped, and the others carry on. Returns the total
+    number of games imported.
+    """
+    queue = deque((client, iter(games)) for client, games in streams.items())
+    total = 0
+    while queue:
+        client, games = queue.popleft()
+        try:
+            game = next(games, None)
+        except requests.exceptions.RequestException as error:
+            client.failed_users.append((client.username, describe_error(error)))
+            print(f"Could not fetch {client.username}'s games ({describe_error(error)}) - skipping them")
+            continue
+        if game is None:
+            continue
+        # Games between two of the users appear in both archives, and the
+        # dedup stages run ahead of the imports, so check again here
+        if client.database.is_imported(game.tags.game_id):
+            client.already_imported += 1
+            queue.append((client, games))
+            continue
+        if not client.import_game(game):
+            queue.append((client, games))
+            continue
+        client.imported += 1
+        total += 1
+        if total % FLUSH_SIZE == 0:
+            client.flush()
+        if verbose:
+            print(f"[{client.username}] Imported {client.imported} ({total} in total)")
+        queue.append((client, games))
+    for client in streams:
+        print(
+            f"{client.username}: {client.imported} imported, {client.already_imported} of "
+            f"{client.requested} requested games already imported"
+        )
+    return total
+
+
+# ---------------------------------SIMULATION----------------------------------#
+
+
+class VirtualClock:
+    """
+    Stand-in for time.monotonic and time.sleep that never actually waits:
+    sleeping just moves the clock forward. Passed to the rate limiter (and
+    Chess2Lichess) to replay rate-limited runs in a fraction of the time.
+    """
+
+    def __init__(self, start=0.0) -> None:
+        self.now = start
+        self.lock = Lock()
+
+    def time(self) -> float:
+        """
+        Returns the current virtual time in seconds.
+        """
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Advances the virtual time by seconds.
+        """
+        with self.lock:
+            self.now += max(seconds, 0)
+
+
+class StubLichessAdapter(BaseAdapter):
+    """
+    Transport adapter that answers lichess.org imports in-process, the way the
+    real endpoint would with an import limit of limit games per minute
+    measured on a virtual clock: anything over the limit gets a 429. Mounted
+    on a session in place of the network, it records when every game was
+    accepted.
+    """
+
+    def __init__(self, clock: VirtualClock, limit=SIMULATED_IMPORT_LIMIT, burst=1) -> None:
+        super().__init__()
+        self.clock = clock
+        self.rate = limit / 60
+        self.burst = burst
+        self.tokens = burst
+        self.updated = clock.time()
+        self.accepted = []
+        self.throttled = 0
+
+    def send(self, request, **kwargs) -> requests.Response:
+        """
+        Answers one import request with a 200, or a 429 over the limit.
+        """
+        now = self.clock.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.connection = self
+        response.encoding = "utf-8"
+        if self.tokens < 1:
+            self.throttled += 1
+            response.status_code = 429
+            response._content = b"Too many requests. Try again later."
+            return response
+        self.tokens -= 1
+        self.accepted.append(now)
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(
+            {"id": f"sim{len(self.accepted):05d}", "url": "https://lichess.org/"}
+        ).encode()
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def simulated_games(count: int):
+    """
+    Yields count minimal chess.com games with distinct game IDs.
+    """
+    for index in range(count):
+        pgn = (
+            '[Event "Live Chess"]\n[Site "Chess.com"]\n[UTCDate "2020.01.01"]\n'
+            '[UTCTime "12:00:00"]\n[White "white"]\n[Black "black"]\n'
+            '[Result "1-0"]\n[TimeControl "180"]\n'
+            f'[Link "https://www.chess.com/game/live/{index}"]\n\n1. e4 e5 1-0\n'
+        )
+        yield Game(pgn, parse_tags(pgn))
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Formats a duration in seconds as days, hours, minutes and seconds.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours:02d}h{minutes:02d}m"
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+
+def simulate(
+    count: int,
+    rate=IMPORT_RATE,
+    max_rate=MAX_IMPORT_RATE,
+    limit=SIMULATED_IMPORT_LIMIT,
+    verbose=False,
+    stats=None,
+) -> dict:
+    """
+    Replays the import of count games through the real import path - rate
+    limiter, retries and local files - against a stub lichess.org with the
+    given import limit, on a virtual clock. Prints the projected schedule and
+    returns it with the throughput and the number of throttled imports. The
+    local files are written to a temporary directory.
+    """
+    clock = VirtualClock()
+    stub = StubLichessAdapter(clock, limit)
+    with tempfile.TemporaryDirectory() as directory:
+        client = Chess2Lichess(
+            "simulation",
+            verbose,
+            convert_local=False,
+            rate_limiter=RateLimiter(rate, max_rate, clock=clock.time, sleep=clock.sleep),
+            database=CsvDatabase(os.path.join(directory, CSV_DATABASE)),
+            local_pgns=LocalPgns(
+                os.path.join(directory, LOCAL_PGNS), os.path.join(directory, PGN_INDEX)
+            ),
+            journal=ImportJournal(os.path.join(directory, JOURNAL)),
+            stats=stats,
+            sleep=clock.sleep,
+        )
+        client.session.mount(LICHESS_IMPORT_URL, stub)
+        # The client reports every throttled import, which is noise here
+        with open(os.devnull, "w") as devnull:
+            with nullcontext() if verbose else redirect_stdout(devnull):
+                client.check_db_existence()
+                imported = client.import_pgns(simulated_games(count))
+        client.close()
+
+    elapsed = clock.time()
+    schedule = []
+    for tenth in range(1, 11):
+        games = math.ceil(imported * tenth / 10)
+        if games and (not schedule or games > schedule[-1]["games"]):
+            schedule.append({"games": games, "seconds": round(stub.accepted[games - 1], 1)})
+    result = {
+        "games": imported,
+        "seconds": round(elapsed, 1),
+        "games_per_minute": round(imported / elapsed * 60, 2) if elapsed else None,
+        "throttled": stub.throttled,
+        "waited_seconds": round(client.rate_limiter.waited, 1),
+        "schedule": schedule,
+    }
+
+    print(
+        f"Simulated {imported} imports at {rate:g}-{max_rate:g} games/min against a "
+        f"limit of {limit:g} games/min"
+    )
+    for point in schedule:
+        print(f"  {point['games']:>8} games after {format_duration(point['seconds'])}")
+    print(
+        f"Projected duration {format_duration(elapsed)} ({result['games_per_minute']} games/min), "
+        f"{stub.throttled} imports throttled, {format_duration(result['waited_seconds'])} spent waiting"
+    )
+    finish = datetime.now() + relativedelta(seconds=int(elapsed))
+    print(f"Started now, the imports would finish around {finish:%Y/%m/%d %H:%M}")
+    return result
 
 
 # -----------------------------------PARSING-----------------------------------#
@@ -290,7 +3186,15 @@ if __name__ == "__main__":
 
     parser.add_argument(
         "username",
-        help="the chess.com username of the profile you want to download games from",
+        nargs="*",
+        help="the chess.com username(s) of the profiles you want to download games from",
+    )
+
+    parser.add_argument(
+        "-U",
+        "--users-file",
+        help="read more chess.com usernames from a file, one per line",
+        metavar="FILE",
     )
 
     parser.add_argument(
@@ -317,6 +3221,171 @@ if __name__ == "__main__":
         help="stop the script from converting date/time from UTC to local timezone",
     )
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"number of months to download at once in range mode (default: {MAX_WORKERS})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=POOL_SIZE,
+        help=f"number of keep-alive connections kept open per host (default: {POOL_SIZE})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        help=f"seconds to wait for a connection to chess.com or lichess.org (default: {CONNECT_TIMEOUT})",
+        metavar="SECONDS",
+    )
+
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        help=f"seconds to wait for the next bytes of a response before giving up on it (default: {READ_TIMEOUT})",
+        metavar="SECONDS",
+    )
+
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=FETCH_ATTEMPTS,
+        help=f"times a month is requested in range mode before it counts as failed (default: {FETCH_ATTEMPTS})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        help="in range mode, request a month again if it hasn't downloaded after SECONDS and use whichever copy arrives first",
+        metavar="SECONDS",
+    )
+
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        default=False,
+        help="in range mode, skip months that can't be fetched and list them at the end instead of stopping",
+    )
+
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=IMPORT_RATE,
+        help=f"games imported per minute at the start of the run (default: {IMPORT_RATE})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=MAX_IMPORT_RATE,
+        help=f"games imported per minute the rate limiter may ramp up to (default: {MAX_IMPORT_RATE})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "--private-limit",
+        action="store_true",
+        default=False,
+        help="don't share the import rate limit with other runs using the same LICHESS_TOKEN",
+    )
+
+    parser.add_argument(
+        "--report",
+        help="time every stage of the run and write the totals, counts and percentiles to a JSON file",
+        metavar="FILE",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        help="keep Prometheus metrics (latencies, status codes, retries, rate limit waits) in FILE for the textfile collector",
+        metavar="FILE",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics at http://localhost:PORT/metrics while running",
+        metavar="PORT",
+    )
+
+    parser.add_argument(
+        "--sqlite",
+        action="store_true",
+        default=False,
+        help=f"keep the local 'database' in {SQLITE_DATABASE} instead of {CSV_DATABASE}, migrating an existing {CSV_DATABASE} on first use",
+    )
+
+    parser.add_argument(
+        "--id-index",
+        action="store_true",
+        default=False,
+        help=f"look imported game IDs up in a compact memory-mapped index ({ID_INDEX}) instead of loading every ID in {CSV_DATABASE} into memory",
+    )
+
+    parser.add_argument(
+        "--bloom",
+        action="store_true",
+        default=False,
+        help="put a Bloom filter in front of the --id-index index",
+    )
+
+    parser.add_argument(
+        "--segmented",
+        action="store_true",
+        default=False,
+        help=f"keep the full PGN text in {PGN_ARCHIVE}/, one segment per player and month compressed once the month is over, instead of in {LOCAL_PGNS}",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help=f"always download monthly archives instead of using the cache in {CACHE_DIR}",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_MAX_BYTES // 2**20,
+        help=f"size in MB the archive cache is trimmed to (default: {CACHE_MAX_BYTES // 2**20})",
+        metavar="MB",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="overlap fetching, filtering and importing in separate threads",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=QUEUE_SIZE,
+        help=f"number of games buffered between pipeline stages (default: {QUEUE_SIZE})",
+        metavar="N",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--json",
+        action="store_true",
+        default=False,
+        help="read games from chess.com's structured JSON endpoint instead of the PGN one",
+    )
+
     modes = parser.add_mutually_exclusive_group(required=True)
     modes.add_argument(
         "-c",
@@ -331,6 +3400,15 @@ if __name__ == "__main__":
         metavar="YYYY/MM",
         help="import chess.com games from the specified month to lichess.org",
     )
+    modes.add_argument(
+        "-W",
+        "--watch",
+        nargs="?",
+        type=int,
+        const=WATCH_INTERVAL,
+        metavar="SECONDS",
+        help=f"keep importing new games from the current month as they are played, polling every SECONDS (default: {WATCH_INTERVAL})",
+    )
     modes.add_argument(
         "-r",
         "--range",
@@ -338,26 +3416,196 @@ if __name__ == "__main__":
         metavar="YYYY/MM",
         help="import chess.com games from months in the specified range to lichess.org",
     )
+    modes.add_argument(
+        "-g",
+        "--get",
+        nargs="+",
+        metavar="GAME_ID",
+        help=f"print imported games from {LOCAL_PGNS} by their chess.com game ID",
+    )
+    modes.add_argument(
+        "--read-archive",
+        nargs="+",
+        metavar=("USER", "YYYY/MM"),
+        help=f"print a player's games, or one month of them, from the segmented archive in {PGN_ARCHIVE}/",
+    )
+    modes.add_argument(
+        "--archive-stats",
+        action="store_true",
+        help=f"summarise the segmented archive in {PGN_ARCHIVE}/ and check every segment against its checksum",
+    )
+    modes.add_argument(
+        "--index-pgns",
+        action="store_true",
+        help=f"rebuild the index of where each game is in {LOCAL_PGNS} from scratch",
+    )
+    modes.add_argument(
+        "-S",
+        "--simulate",
+        type=int,
+        metavar="GAMES",
+        help="project how long importing GAMES games would take with the given --rate and --max-rate, replaying the imports against a stand-in for lichess.org on a virtual clock",
+    )
+
+    parser.add_argument(
+        "--lichess-limit",
+        type=float,
+        default=SIMULATED_IMPORT_LIMIT,
+        help=f"import limit in games per minute of the stand-in for lichess.org in simulate mode (default: {SIMULATED_IMPORT_LIMIT})",
+        metavar="N",
+    )
 
     args = parser.parse_args()
 
+    # Reading games back from the local PGN text document needs no user either
+    if args.get or args.index_pgns:
+        local_pgns = LocalPgns()
+        if args.index_pgns:
+            local_pgns.index(rebuild=True)
+        missing = 0
+        for game_id in args.get or []:
+            pgn = local_pgns.lookup(game_id)
+            if pgn is None:
+                print(f"Game {game_id} is not in {LOCAL_PGNS}")
+                missing += 1
+            else:
+                print(pgn, end="\n\n\n")
+        local_pgns.close()
+        exit(1 if missing else 0)
+
+    if args.read_archive or args.archive_stats:
+        archive = SegmentedArchive()
+        if args.archive_stats:
+            print(archive.summary())
+            bad = archive.verify()
+            for name in bad:
+                print(f"Segment {name} is missing or doesn't match its checksum")
+            exit(1 if bad else 0)
+        if len(args.read_archive) > 2:
+            parser.error("--read-archive takes a player and optionally a month")
+        for pgn in archive.read(*args.read_archive):
+            print(pgn, end="\n\n\n")
+        exit(0)
+
+    # Simulate mode needs no chess.com user and touches no local files
+    if args.simulate is not None:
+        stats = StageTimer(enabled=bool(args.report))
+        simulate(
+            args.simulate,
+            args.rate,
+            max(args.rate, args.max_rate),
+            args.lichess_limit,
+            args.verbose,
+            stats,
+        )
+        if args.report:
+            stats.write(args.report)
+        exit(0)
+
+    usernames = list(args.username)
+    if args.users_file:
+        usernames += read_usernames(args.users_file)
+    if not usernames:
+        parser.error("at least one chess.com username is required")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch takes a polling interval of at least one second")
+    if args.watch is not None and len(usernames) > 1:
+        parser.error("watch mode takes a single chess.com username")
+    if args.id_index and args.sqlite:
+        parser.error("--id-index indexes the .csv 'database'; SQLite has its own index")
+
     # Instantiate Chess2Liches object
-    c2l = Chess2Lichess(args.username, args.verbose, convert_local=args.utc)
+    c2l = Chess2Lichess(
+        usernames[0],
+        args.verbose,
+        convert_local=args.utc,
+        max_workers=args.workers,
+        pool_size=args.pool_size,
+        rate_limiter=make_rate_limiter(
+            args.rate, max(args.rate, args.max_rate), shared=not args.private_limit
+        ),
+        database=SqliteDatabase()
+        if args.sqlite
+        else CsvDatabase(index=IdIndex(bloom=args.bloom) if args.id_index else None),
+        local_pgns=SegmentedArchive() if args.segmented else LocalPgns(),
+        cache=None if args.no_cache else ArchiveCache(max_bytes=args.cache_size * 2**20),
+        source="json" if args.json else "pgn",
+        stats=StageTimer(enabled=bool(args.report)),
+        metrics=Metrics() if args.metrics_file or args.metrics_port else None,
+        metrics_file=args.metrics_file,
+        timeout=(args.connect_timeout, args.read_timeout),
+        fetch_attempts=args.attempts,
+        hedge_after=args.hedge,
+        keep_going=args.keep_going,
+    )
+    if args.metrics_port:
+        c2l.metrics.serve(args.metrics_port)
 
     # Check for existence of 'database', create if necessary
     c2l.check_db_existence()
 
-    # Fetch requested PGNs
-    if args.current:
-        pgns = c2l.fetch_current_month()
-    elif args.month:
-        pgns = c2l.fetch_month(args.month[0])
-    elif args.range:
-        pgns = c2l.fetch_range(args.range[0], args.range[1])
-    # Filter PGNs on time control if requested
-    if args.filter:
-        pgns = c2l.filter_pgns(pgns, args.filter)
-    # Check to see which PGNs have already been imported
-    pgns = c2l.check_already_imported(pgns)
-    # Import the requested games to lichess.org
-    c2l.import_pgns(pgns)
+    def requested_games(client):
+        """
+        Chains the fetch, filter and dedup stages for one user.
+        """
+        # Fetch requested games, parsing each one's tags once
+        if args.current:
+            pgns = client.fetch_current_month()
+        elif args.month:
+            pgns = client.fetch_month(args.month[0])
+        elif args.range:
+            pgns = client.fetch_range(args.range[0], args.range[1])
+        # In pipelined mode the fetch stage runs ahead in its own thread
+        if args.pipeline:
+            pgns = pipelined(pgns, args.queue_size)
+        # Filter PGNs on time control if requested
+        if args.filter:
+            pgns = client.filter_pgns(pgns, args.filter)
+        # Check to see which PGNs have already been imported
+        return client.check_already_imported(pgns)
+
+    try:
+        # Watch mode runs until interrupted
+        if args.watch is not None:
+            c2l.watch(args.watch, args.filter)
+            exit(0)
+        # Several users share one rate budget, taking turns game by game,
+        # while every user's games are fetched concurrently
+        if len(usernames) > 1:
+            clients = [c2l.for_user(username) for username in usernames]
+            streams = {
+                client: pipelined(requested_games(client), args.queue_size)
+                for client in clients
+            }
+            imported = import_round_robin(streams, args.verbose)
+            if args.verbose:
+                print(f"Imported {c2l.rate_limiter.summary(imported)}")
+                c2l.report_http()
+            c2l.report_failed_months()
+            c2l.report_failed_users()
+            c2l.report_rejected()
+            exit(0 if imported and not c2l.failed_months and not c2l.failed_users else 1)
+        pgns = requested_games(c2l)
+        # ...and so does the filter/dedup stage, feeding the importer
+        if args.pipeline:
+            pgns = pipelined(pgns, args.queue_size)
+        # Import the requested games to lichess.org as they stream in
+        imported = c2l.import_pgns(pgns)
+        c2l.report_failed_months()
+        c2l.report_rejected()
+        if c2l.failed_months:
+            exit(1)
+        if not imported:
+            if c2l.rejected:
+                print("lichess.org rejected every game that was left to import!")
+            elif c2l.requested:
+                print("All requested games have already been imported!")
+            elif c2l.filtered_out:
+                print("There are no games that pass your filter!")
+            else:
+                print("There are no games to import!")
+            exit(1)
+    finally:
+        c2l.close()
+        if args.report:
+            c2l.stats.write(args.report)
@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep, time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess2lichess as c2l  # noqa: E402
+
+
+def make_pgn(year: int, month: int, index: int) -> str:
+    """
+    Returns a minimal chess.com game whose ID encodes when it was played, so
+    sorting IDs sorts games chronologically.
+    """
+    return (
+        f'[Event "Live Chess"]\n[Site "Chess.com"]\n[Date "{year}.{month:02d}.01"]\n'
+        f'[White "white"]\n[Black "black"]\n[Result "1-0"]\n'
+        f'[UTCDate "{year}.{month:02d}.01"]\n[UTCTime "12:00:{index:02d}"]\n'
+        f'[TimeControl "180"]\n[Termination "white won by resignation"]\n'
+        f'[Link "https://www.chess.com/game/live/{year}{month:02d}{index:03d}"]\n\n'
+        "1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0"
+    )
+
+
+def game_ids(year: int, month: int, count: int) -> list:
+    """
+    Returns the IDs of the games make_pgn builds for a month, in order.
+    """
+    return [f"{year}{month:02d}{index:03d}" for index in range(count)]
+
+
+class StubServer:
+    """
+    Local stand-in for the chess.com published-data API and the lichess.org
+    import endpoint. Every player has the same games: games_per_month games
+    in each month of months, except missing_users, who don't exist. Months can
+    be made slow with delays, and the archives list and imports can be made
+    to fail. Every GET path and the time of every import are recorded.
+    """
+
+    def __init__(self, months=(), games_per_month=3) -> None:
+        self.months = set(months)
+        self.games_per_month = games_per_month
+        self.missing_users = set()
+        self.delays = {}
+        self.archives_status = 200
+        self.archives_body = None
+        self.import_status = 200
+        self.paths = []
+        self.imports = []
+        self.lock = Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def requested_months(self) -> list:
+        """
+        Returns the (year, month) of every monthly archive requested.
+        """
+        months = []
+        for path in self.paths:
+            parts = path.strip("/").split("/")
+            if len(parts) >= 5 and parts[2] == "games" and parts[3].isdigit():
+                months.append((int(parts[3]), int(parts[4])))
+        return months
+
+    def handler(self):
+        """
+        Builds the request handler class bound to this server.
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send(self, status: int, body: str, content_type="text/plain"):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # /chesscom/<user>/games/archives, .../games/YYYY/MM/pgn
+                with stub.lock:
+                    stub.paths.append(self.path)
+                parts = self.path.strip("/").split("/")
+                if parts[1] in stub.missing_users:
+                    return self.send(404, json.dumps({"code": 0, "message": "User not found"}))
+                if parts[-1] == "archives":
+                    if stub.archives_status != 200:
+                        return self.send(stub.archives_status, "")
+                    archives = [
+                        f"{stub.url}/chesscom/{parts[1]}/games/{year}/{month:02d}"
+                        for year, month in sorted(stub.months)
+                    ]
+                    body = stub.archives_body or json.dumps({"archives": archives})
+                    return self.send(200, body, "application/json")
+                year, month = int(parts[3]), int(parts[4])
+                sleep(stub.delays.get((year, month), 0))
+                count = stub.games_per_month if (year, month) in stub.months else 0
+                self.send(200, "\n\n\n".join(make_pgn(year, month, i) for i in range(count)))
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.lock:
+                    stub.imports.append(time())
+                if stub.import_status != 200:
+                    return self.send(stub.import_status, "")
+                self.send(200, json.dumps({"id": "AbCdEfGh"}), "application/json")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    """
+    Runs a StubServer, points the script at it and runs the test in an empty
+    directory so the local files start afresh.
+    """
+    server = StubServer()
+    Thread(target=server.server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(c2l, "CHESSCOM_API", f"{server.url}/chesscom")
+    monkeypatch.setattr(c2l, "LICHESS_IMPORT_URL", f"{server.url}/import")
+    monkeypatch.chdir(tmp_path)
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
@@ -0,0 +1,22 @@
+from conftest import c2l, game_ids
+
+
+def test_failed_user_does_not_stop_the_batch(stub):
+    stub.months.add((2021, 1))
+    stub.missing_users.add("ghost")
+    alice = c2l.Chess2Lichess("alice", False, False, rate_limiter=c2l.RateLimiter(6000, 6000))
+    ghost = alice.for_user("ghost")
+    try:
+        alice.check_db_existence()
+        streams = {
+            client: c2l.pipelined(client.check_already_imported(client.fetch_month("2021/01")))
+            for client in (ghost, alice)
+        }
+        imported = c2l.import_round_robin(streams)
+    finally:
+        alice.close()
+
+    assert imported == 3
+    assert alice.imported == 3
+    assert alice.failed_users == [("ghost", "HTTP 404")]
+    assert len(stub.imports) == len(game_ids(2021, 1, 3))
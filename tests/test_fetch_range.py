@@ -0,0 +1,75 @@
+from time import perf_counter
+
+import pytest
+
+from conftest import c2l, game_ids
+
+
+def fetch_ids(workers: int, start: str, end: str) -> list:
+    """
+    Fetches a range of months from the stub and returns the game IDs in the
+    order fetch_range yielded them.
+    """
+    client = c2l.Chess2Lichess("player", False, False, max_workers=workers)
+    try:
+        return [game.tags.game_id for game in client.fetch_range(start, end)]
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("workers", [1, 8])
+def test_range_is_chronological(stub, workers):
+    months = [(2021, month) for month in range(1, 13)]
+    stub.months.update(months)
+    # Earlier months are slower, so with several workers they finish last
+    for position, month in enumerate(months):
+        stub.delays[month] = 0.01 * (len(months) - position)
+
+    ids = fetch_ids(workers, "2021/01", "2021/12")
+
+    assert ids == [i for year, month in months for i in game_ids(year, month, 3)]
+
+
+def test_workers_speed_up_range(stub):
+    months = [(2021, month) for month in range(1, 13)]
+    stub.months.update(months)
+    stub.delays.update((month, 0.1) for month in months)
+
+    started = perf_counter()
+    serial = fetch_ids(1, "2021/01", "2021/12")
+    serial_seconds = perf_counter() - started
+    started = perf_counter()
+    concurrent = fetch_ids(8, "2021/01", "2021/12")
+    concurrent_seconds = perf_counter() - started
+
+    assert concurrent == serial
+    # 12 months of 0.1s each: at least 1.2s one at a time, about 0.2s with 8
+    assert serial_seconds >= 1.2
+    assert concurrent_seconds < serial_seconds / 3
+
+
+def test_only_months_in_archives_are_requested(stub):
+    sparse = [(2020, 3), (2020, 11), (2021, 6)]
+    stub.months.update(sparse)
+
+    ids = fetch_ids(4, "2020/01", "2021/12")
+
+    assert sorted(stub.requested_months()) == sparse
+    assert ids == [i for year, month in sparse for i in game_ids(year, month, 3)]
+
+
+@pytest.mark.parametrize("failure", ["status", "malformed"])
+def test_every_month_is_requested_without_archives(stub, failure):
+    sparse = [(2020, 3), (2020, 11), (2021, 6)]
+    stub.months.update(sparse)
+    if failure == "status":
+        stub.archives_status = 404
+    else:
+        stub.archives_body = "<html>maintenance</html>"
+
+    ids = fetch_ids(4, "2020/01", "2021/12")
+
+    assert sorted(stub.requested_months()) == [
+        (year, month) for year in (2020, 2021) for month in range(1, 13)
+    ]
+    assert ids == [i for year, month in sparse for i in game_ids(year, month, 3)]
@@ -0,0 +1,60 @@
+import csv
+
+from conftest import c2l, game_ids, make_pgn
+
+
+def test_runs_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / c2l.JOURNAL)
+    first = c2l.ImportJournal(path, run=1)
+    second = c2l.ImportJournal(path, run=2)
+    first.posting("1")
+    second.posting("2")
+    first.posted("1", "pgn 1", True)
+    second.posted("2", "pgn 2", True)
+    first.recorded("1")
+    first.checkpoint()
+    second.checkpoint()
+
+    # The second run is still going, so its journal isn't recovered
+    assert c2l.ImportJournal(path, run=3).recover() == ([], 0)
+
+    # Once it ends, its unrecorded game is
+    second.file.close()
+    later = c2l.ImportJournal(path, run=3)
+    entries, uncertain = later.recover()
+    assert [entry["game_id"] for entry in entries] == ["2"]
+    assert uncertain == 0
+    later.checkpoint()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_interrupted_run_is_recovered(stub, tmp_path):
+    stub.months.add((2021, 1))
+    recovered, uncertain, untouched = game_ids(2021, 1, 3)
+    # An interrupted run had the first game accepted but never recorded it,
+    # and was cut off while posting the second
+    crashed = c2l.ImportJournal(run=99)
+    crashed.posting(recovered)
+    crashed.posted(recovered, make_pgn(2021, 1, 0), False)
+    crashed.posting(uncertain)
+    crashed.file.close()
+
+    client = c2l.Chess2Lichess(
+        "player", False, False, rate_limiter=c2l.RateLimiter(6000, 6000)
+    )
+    try:
+        client.check_db_existence()
+        # Recorded from the journal without posting it again
+        assert stub.imports == []
+        games = client.check_already_imported(client.fetch_month("2021/01"))
+        imported = client.import_pgns(games)
+    finally:
+        client.close()
+
+    # Only the game that may not have reached lichess.org and the one never
+    # tried are posted, each exactly once
+    assert imported == 2
+    assert len(stub.imports) == 2
+    with open(c2l.CSV_DATABASE) as file:
+        assert [row[0] for row in csv.reader(file)][1:] == [recovered, uncertain, untouched]
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith("import_journal")]
@@ -0,0 +1,69 @@
+import csv
+
+from conftest import c2l, game_ids
+
+
+class CountingPattern:
+    """
+    Wraps a compiled regex and counts every call made through it.
+    """
+
+    def __init__(self, pattern) -> None:
+        self.pattern = pattern
+        self.calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.pattern, name)
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return method(*args, **kwargs)
+
+        return counted
+
+
+def test_each_game_is_parsed_once(stub, monkeypatch):
+    stub.months.add((2021, 1))
+    stub.games_per_month = 20
+    pattern = CountingPattern(c2l.TAG_PAIR_PATTERN)
+    monkeypatch.setattr(c2l, "TAG_PAIR_PATTERN", pattern)
+    client = c2l.Chess2Lichess(
+        "player", False, False, rate_limiter=c2l.RateLimiter(6000, 6000)
+    )
+    try:
+        client.check_db_existence()
+        games = client.fetch_month("2021/01")
+        games = client.filter_pgns(games, ["blitz"])
+        imported = client.import_pgns(client.check_already_imported(games))
+    finally:
+        client.close()
+
+    assert imported == 20
+    # Fetching, filtering, deduplicating, importing and recording a game
+    # scans its headers exactly once
+    assert pattern.calls == 20
+    with open(c2l.CSV_DATABASE) as file:
+        assert [row[0] for row in csv.reader(file)][1:] == game_ids(2021, 1, 20)
+
+
+def test_server_errors_reject_a_game(stub, monkeypatch):
+    stub.months.add((2021, 1))
+    stub.games_per_month = 1
+    stub.import_status = 502
+    monkeypatch.setattr(c2l, "THROTTLE_PAUSE", 0)
+    monkeypatch.setattr(c2l, "BASE_BACKOFF", 0)
+    client = c2l.Chess2Lichess(
+        "player", False, False, rate_limiter=c2l.RateLimiter(6000, 6000)
+    )
+    try:
+        client.check_db_existence()
+        imported = client.import_pgns(client.fetch_month("2021/01"))
+    finally:
+        client.close()
+
+    # Given up on after IMPORT_ATTEMPTS server errors rather than retried forever
+    assert imported == 0
+    assert len(stub.imports) == c2l.IMPORT_ATTEMPTS
+    assert client.rejected == [
+        ("player", game_ids(2021, 1, 1)[0], f"HTTP 502 on {c2l.IMPORT_ATTEMPTS} attempts in a row")
+    ]
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from conftest import c2l
+
+# Games per minute every process is allowed, and games each one imports
+RATE = 600
+GAMES = 10
+PROCESSES = 3
+
+
+def test_processes_share_one_rate_limit(stub, tmp_path):
+    stub.months.add((2021, 1))
+    stub.games_per_month = GAMES
+    env = dict(
+        os.environ,
+        CHESSCOM_API=c2l.CHESSCOM_API,
+        LICHESS_IMPORT_URL=c2l.LICHESS_IMPORT_URL,
+        LICHESS_TOKEN="shared-token",
+        XDG_RUNTIME_DIR=str(tmp_path / "run"),
+    )
+    os.makedirs(env["XDG_RUNTIME_DIR"])
+    runs = []
+    for number in range(PROCESSES):
+        directory = tmp_path / f"process{number}"
+        directory.mkdir()
+        runs.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.abspath(c2l.__file__),
+                    f"player{number}",
+                    "-m",
+                    "2021/01",
+                    "--rate",
+                    str(RATE),
+                    "--max-rate",
+                    str(RATE),
+                    "--no-cache",
+                ],
+                cwd=directory,
+                env=env,
+                stdout=subprocess.DEVNULL,
+            )
+        )
+    assert [run.wait(timeout=60) for run in runs] == [0] * PROCESSES
+
+    imports = sorted(stub.imports)
+    assert len(imports) == PROCESSES * GAMES
+    # Together the processes stay at one process's rate. Each at its own
+    # rate would import three times as fast.
+    per_second = (len(imports) - 1) / (imports[-1] - imports[0])
+    assert per_second <= RATE / 60 * 1.2
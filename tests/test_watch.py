@@ -0,0 +1,39 @@
+import json
+from datetime import datetime, timezone
+
+from requests.adapters import HTTPAdapter
+
+from conftest import c2l
+
+
+def test_watch_survives_a_failed_poll(stub, monkeypatch, capsys):
+    now = datetime.now(timezone.utc)
+    stub.months.add((now.year, now.month))
+    api = c2l.CHESSCOM_API
+    # Nothing listens on port 1, so the first poll can't connect
+    monkeypatch.setattr(c2l, "CHESSCOM_API", "http://127.0.0.1:1/chesscom")
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            monkeypatch.setattr(c2l, "CHESSCOM_API", api)
+        else:
+            raise KeyboardInterrupt
+
+    client = c2l.Chess2Lichess(
+        "player", False, False, rate_limiter=c2l.RateLimiter(6000, 6000), sleep=sleep
+    )
+    # Fail at once instead of after the session's own retries
+    client.session.mount("http://", HTTPAdapter(max_retries=0))
+    try:
+        client.check_db_existence()
+        client.watch(interval=5)
+    finally:
+        client.close()
+
+    assert sleeps == [5, 5]
+    assert "Polling failed" in capsys.readouterr().out
+    assert len(stub.imports) == 3
+    with open(c2l.WATCH_STATE) as file:
+        assert json.load(file)["player"]["seen"] == 3